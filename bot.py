@@ -4,6 +4,7 @@
 import logging
 import traceback
 import datetime
+import time
 from typing import Optional
 
 from discord import Intents
@@ -11,6 +12,12 @@ import aiohttp
 import discord
 from discord.ext import commands
 
+from utils.metrics import metrics
+from utils.render import RenderError, RenderService
+from utils.router import MessageRouter
+from utils.telemetry import TelemetrySink
+from utils.watchdog import LoopWatchdog
+
 log = logging.getLogger(__name__)
 
 initial_extensions = (
@@ -46,7 +53,29 @@ class DDNet(commands.Bot):
         self.pool = kwargs.pop('pool')
         self.session = kwargs.pop('session')
 
+        columns = ('guild_id', 'channel_id', 'author_id', 'timestamp', 'command')
+        self.command_stats = TelemetrySink(self.pool, 'stats_commands', columns)
+
+        self.router = MessageRouter()
+
+        render = self.config['RENDER'] if self.config.has_section('RENDER') else {}
+        self.renderer = RenderService(
+            workers=self.config.getint('RENDER', 'WORKERS', fallback=2),
+            queue_size=self.config.getint('RENDER', 'QUEUE', fallback=8),
+            timeout=self.config.getfloat('RENDER', 'TIMEOUT', fallback=30.0),
+            formats={k[len('format_'):]: v for k, v in render.items() if k.startswith('format_')}
+        )
+
+        threshold = self.config.getfloat('MONITOR', 'LOOP_LAG_THRESHOLD', fallback=250.0)
+        self.watchdog = LoopWatchdog(threshold=threshold / 1000)
+
     async def setup_hook(self):
+        self.command_stats.start()
+        self.renderer.start()
+
+        if self.config.getboolean('MONITOR', 'LOOP_LAG', fallback=False):
+            self.watchdog.start()
+
         for extension in initial_extensions:
             try:
                 await self.load_extension(extension)
@@ -69,14 +98,45 @@ class DDNet(commands.Bot):
 
     async def close(self):
         log.info('Closing')
+        self.watchdog.stop()
         await super().close()
+        await self.command_stats.close()
+        self.renderer.close()
+        log.info('Command stats: %s', ', '.join(f'{k}={v}' for k, v in self.command_stats.stats().items()))
         await self.pool.close()
         await self.session.close()
 
+    async def add_cog(self, cog: commands.Cog, **kwargs):
+        await super().add_cog(cog, **kwargs)
+        self.router.add_cog(cog)
+
+    async def remove_cog(self, name: str, **kwargs) -> Optional[commands.Cog]:
+        cog = await super().remove_cog(name, **kwargs)
+        if cog is not None:
+            self.router.remove_cog(cog)
+
+        return cog
+
     async def on_message(self, message: discord.Message):
         await self.wait_until_ready()
+
+        for handler in self.router.handlers_for(message):
+            self._schedule_event(handler, 'on_message', message)
+
         await self.process_commands(message)
 
+    def _schedule_event(self, coro, event_name: str, *args, **kwargs):
+        # every listener, including routed message handlers, passes through here
+        coro = metrics.timed('listener', coro.__qualname__)(coro)
+        return super()._schedule_event(coro, event_name, *args, **kwargs)
+
+    async def invoke(self, ctx: commands.Context):
+        start = time.perf_counter()
+        await super().invoke(ctx)
+
+        if ctx.command is not None:
+            metrics.observe('command', ctx.command.qualified_name, time.perf_counter() - start, ctx.command_failed)
+
     def global_check(self, ctx: commands.Context) -> bool:
         return ctx.guild is None or ctx.channel.permissions_for(ctx.guild.me).send_messages
 
@@ -90,9 +150,6 @@ class DDNet(commands.Bot):
 
         log.info('%s used command in %s: %s', ctx.author, destination, ctx.message.content)
 
-        query = """INSERT INTO stats_commands (guild_id, channel_id, author_id, timestamp, command)
-                   VALUES ($1, $2, $3, $4, $5);
-                """
         values = (
             guild_id,
             ctx.channel.id,
@@ -101,7 +158,7 @@ class DDNet(commands.Bot):
             ctx.command.qualified_name
         )
 
-        await self.pool.execute(query, *values)
+        self.command_stats.record(values)
 
     async def on_command_error(self, ctx: commands.Context, error: commands.CommandError):
         command = ctx.command
@@ -114,6 +171,8 @@ class DDNet(commands.Bot):
                 msg = 'I do not have proper permission'
             elif isinstance(error.original, discord.HTTPException) and error.original.code == 40005:
                 msg = 'File is too large to upload'
+            elif isinstance(error.original, RenderError):
+                msg = str(error.original)
             else:
                 trace = get_traceback(error.original)
                 log.error('Command %r caused an exception\n%s', command.qualified_name, trace)
@@ -5,9 +5,15 @@ import logging
 import textwrap
 import traceback
 from contextlib import redirect_stdout
-from io import StringIO
+from io import BytesIO, StringIO
+from typing import Optional
+
+import discord
 from discord.ext import commands
 
+from utils.metrics import metrics
+from utils.text import render_table
+
 log = logging.getLogger(__name__)
 
 CONFIRM = '👌'
@@ -105,6 +111,68 @@ class Admin(commands.Cog, command_attrs=dict(hidden=True)):
 
         await self.send_or_paste(ctx, f'```py\n{content}\n```', content)
 
+    @commands.group(name='metrics', invoke_without_command=True)
+    async def _metrics(self, ctx: commands.Context, kind: Optional[str]=None):
+        """Show latency percentiles of commands, listeners and tasks"""
+        rows = metrics.summary(kind)
+        if not rows:
+            return await ctx.send('No samples recorded yet')
+
+        header = ['Kind', 'Name', 'Count', 'Errors', 'p50 ms', 'p95 ms', 'p99 ms', 'Max ms']
+        table = render_table(header, rows)
+        await self.send_or_paste(ctx, f'```\n{table}\n```', table)
+
+    @_metrics.command(name='dump')
+    async def metrics_dump(self, ctx: commands.Context):
+        """Write all latency histograms to logs/metrics.prom in the Prometheus text format"""
+        text = metrics.prometheus()
+        with open('logs/metrics.prom', 'w', encoding='utf-8') as f:
+            f.write(text)
+
+        file = discord.File(BytesIO(text.encode('utf-8')), filename='metrics.prom')
+        await ctx.send(file=file)
+
+    @commands.command()
+    async def looplag(self, ctx: commands.Context, switch: Optional[bool]=None):
+        """Show event loop lag and recent blocking calls, optionally turn the watchdog on or off"""
+        watchdog = self.bot.watchdog
+        if switch is True:
+            watchdog.start()
+        elif switch is False:
+            watchdog.stop()
+
+        lag = metrics.histograms.get(('loop', 'lag'))
+        out = [f'Watchdog: {"on" if watchdog.running else "off"} (threshold {watchdog.threshold * 1000:.0f}ms)']
+        if lag is not None:
+            p50, p95, p99 = (lag.percentile(p) * 1000 for p in (0.5, 0.95, 0.99))
+            out.append(f'Lag: p50 {p50:.1f}ms | p95 {p95:.1f}ms | p99 {p99:.1f}ms | max {lag.max * 1000:.1f}ms')
+
+        if watchdog.stalls:
+            rows = [
+                [s.timestamp.strftime('%Y-%m-%d %H:%M:%S'), f'{s.lag * 1000:.0f}', s.location]
+                for s in reversed(watchdog.stalls)
+            ]
+            out.append(render_table(['Time (UTC)', 'Lag ms', 'Location'], rows))
+        else:
+            out.append('No blocking calls recorded')
+
+        content = '\n'.join(out)
+        await self.send_or_paste(ctx, f'```\n{content}\n```', content)
+
+    @commands.command()
+    async def renderstats(self, ctx: commands.Context):
+        """Show render queue counters and the render and row cache counters"""
+        stats = self.bot.renderer.stats()
+        profile = self.bot.get_cog('Profile')
+        if profile is not None:
+            stats['image_cache'] = profile.image_cache.stats()
+            stats['row_cache'] = profile.row_cache.stats()
+
+        rows = [[name, key, str(round(value, 1))] for name, counters in stats.items() for key, value in counters.items()]
+
+        table = render_table(['Component', 'Counter', 'Value'], rows)
+        await self.send_or_paste(ctx, f'```\n{table}\n```', table)
+
     @commands.command()
     async def shutdown(self, ctx: commands.Context):
         await self.bot.close()
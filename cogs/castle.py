@@ -2,6 +2,8 @@ import discord
 from discord.ext import commands
 from discord.ext.commands import has_permissions
 
+from utils.router import route
+
 GUILD_DDNET     = 252358080522747904
 CHAN_CASTLE    =  959174798955642931
 ROLE_ADMIN      = 293495272892399616
@@ -21,16 +23,14 @@ class Castle(commands.Cog):
         self.bot = bot
 
 
-    @commands.Cog.listener('on_message')
+    @route(channel=CHAN_CASTLE)
     async def unwanted_message_react(self, message: discord.Message):
         author = message.author
-        channel = message.channel
-        if channel.id == CHAN_CASTLE:
-            if not has_attachments(message) and not is_staff(author):
-                await message.delete()
-            if has_attachments(message):
-                await message.add_reaction('⬆️')
-                await message.add_reaction('⬇️')
+        if not has_attachments(message) and not is_staff(author):
+            await message.delete()
+        if has_attachments(message):
+            await message.add_reaction('⬆️')
+            await message.add_reaction('⬇️')
 
 def setup(bot):
     bot.add_cog(Castle(bot))
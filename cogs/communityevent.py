@@ -4,6 +4,8 @@ from discord.ext.commands import has_permissions
 
 import re
 
+from utils.router import route
+
 CHAN_COM_SUBMIT_MAPS    = 929368485417594950
 ROLE_ADMIN              = 293495272892399616
 ROLE_TESTER             = 293543421426008064
@@ -67,11 +69,10 @@ class MapEvent(commands.Cog):
             if member is not None:
                 await member.remove_roles(role)
 
-    @commands.Cog.listener('on_message')
+    @route(channel=CHAN_COM_SUBMIT_MAPS)
     async def handle_unwanted_message(self, message: discord.Message):
         author = message.author
-        channel = message.channel
-        if channel.id == CHAN_COM_SUBMIT_MAPS and not has_attachments(message) and not is_staff(author):
+        if not has_attachments(message) and not is_staff(author):
             if message.author.bot:
                 return
             if message.content.startswith('Mapper:'):
@@ -9,6 +9,8 @@ from datetime import datetime
 import discord
 from discord.ext import commands
 
+from utils.router import route
+
 log = logging.getLogger(__name__)
 
 CHAN_DEVELOPER = 293493549758939136
@@ -138,10 +140,9 @@ class Github(commands.Cog):
     def ratelimited(self) -> bool:
         return self.ratelimit.timestamp >= datetime.utcnow()
 
-    @commands.Cog.listener()
+    @route(channel=CHAN_DEVELOPER)
     async def on_message(self, message: discord.Message):
-        if message.channel.id != CHAN_DEVELOPER or (message.content and message.content[0] == self.bot.command_prefix) \
-		or message.author.bot or self.ratelimited():
+        if (message.content and message.content[0] == self.bot.command_prefix) or message.author.bot or self.ratelimited():
             return
 
         codeblocks = re.findall(r"```(?:\w+\n)?([\s\S]+?)```|`(?:\w+)?(.+?)`", message.content, flags=re.DOTALL)
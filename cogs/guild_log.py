@@ -10,6 +10,7 @@ from typing import List, Tuple
 import discord
 from discord.ext import commands
 
+from utils.router import route
 from utils.text import escape
 
 GUILD_DDNET         = 252358080522747904
@@ -142,14 +143,13 @@ class GuildLog(commands.Cog):
         chan = self.bot.get_channel(CHAN_LOGS)
         await chan.send(embed=embed)
 
-    @commands.Cog.listener()
+    @route(channel=(CHAN_ANNOUNCEMENTS, CHAN_MAP_RELEASES))
     async def on_message(self, message: discord.Message):
         # Can't publish message replies
         if message.reference:
             return
-        
-        if message.channel.id in (CHAN_ANNOUNCEMENTS, CHAN_MAP_RELEASES):
-            await message.publish()
+
+        await message.publish()
 
 
 async def setup(bot: commands.Bot):
@@ -12,6 +12,8 @@ from discord import app_commands
 from cogs.map_testing.log import TestLog
 from cogs.map_testing.map_channel import MapChannel, MapState
 from cogs.map_testing.submission import InitialSubmission, Submission, SubmissionState
+from utils.metrics import metrics
+from utils.router import route
 
 log = logging.getLogger(__name__)
 
@@ -28,9 +30,11 @@ ROLE_TRIAL_TESTER   = 1193593067744284744
 ROLE_TESTING        = 455814387169755176
 WH_MAP_RELEASES     = 345299155381649408
 
+TESTING_CATEGORIES  = (CAT_MAP_TESTING, CAT_WAITING_MAPPER, CAT_EVALUATED_MAPS)
+
 
 def is_testing(channel: discord.TextChannel) -> bool:
-    return isinstance(channel, discord.TextChannel) and channel.category_id in (CAT_MAP_TESTING, CAT_WAITING_MAPPER, CAT_EVALUATED_MAPS)
+    return isinstance(channel, discord.TextChannel) and channel.category_id in TESTING_CATEGORIES
 
 def is_staff(member: discord.Member) -> bool:
     return any(r.id in (ROLE_ADMIN, ROLE_TESTER, ROLE_TRIAL_TESTER) for r in member.roles)
@@ -63,7 +67,7 @@ class MapTesting(commands.Cog):
     async def load_map_channels(self):
         await self.bot.wait_until_ready()
 
-        for category_id in (CAT_MAP_TESTING, CAT_WAITING_MAPPER, CAT_EVALUATED_MAPS):
+        for category_id in TESTING_CATEGORIES:
             category = self.bot.get_channel(category_id)
             for channel in category.text_channels:
                 if channel.id in (CHAN_INFO, CHAN_SUBMIT_MAPS, CHAN_TESTER):
@@ -153,7 +157,7 @@ class MapTesting(commands.Cog):
         else:
             await isubm.set_state(SubmissionState.VALIDATED)
 
-    @commands.Cog.listener('on_message')
+    @route(channel=CHAN_SUBMIT_MAPS, category=TESTING_CATEGORIES)
     async def handle_submission(self, message: discord.Message):
         author = message.author
         if not has_map(message):
@@ -276,7 +280,7 @@ class MapTesting(commands.Cog):
         await self.upload_submission(subm)
         log.info('%s approved submission %r in channel #%s', user, subm.filename, channel)
 
-    @commands.Cog.listener('on_message')
+    @route(channel=CHAN_SUBMIT_MAPS, category=TESTING_CATEGORIES)
     async def handle_unwanted_message(self, message: discord.Message):
         author = message.author
         channel = message.channel
@@ -372,6 +376,7 @@ class MapTesting(commands.Cog):
         return not failed
 
     @tasks.loop(hours=1.0)
+    @metrics.timed('task')
     async def auto_archive(self):
         now = datetime.utcnow()
 
@@ -430,11 +435,8 @@ class MapTesting(commands.Cog):
         except RuntimeError:
             return
 
-    @commands.Cog.listener('on_message')
+    @route(webhook=WH_MAP_RELEASES)
     async def handle_map_release(self, message: discord.Message):
-        if not by_releases_webhook(message):
-            return
-
         map_channel = self.get_map_channel_from_ann(message.content)
         if map_channel is None:
             return
@@ -5,6 +5,8 @@ import re
 import discord
 from discord.ext import commands
 
+from utils.router import route
+
 GUILD_DDNET      = 252358080522747904
 ROLE_ADMIN       = 293495272892399616
 ROLE_DISCORD_MOD = 737776812234506270
@@ -25,9 +27,9 @@ class Moderator(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
 
-    @commands.Cog.listener('on_message')
+    @route(channel=(CHAN_DEV, CHAN_WIKI))
     async def spam_link_filter(self, message: discord.Message):
-        if message.guild is None or message.guild.id != GUILD_DDNET or message.channel.id not in (CHAN_DEV, CHAN_WIKI):
+        if message.guild is None or message.guild.id != GUILD_DDNET:
             return
 
         link_pattern = re.compile(r'https?:\/\/(www\.)?t\.me', re.IGNORECASE) # noqa
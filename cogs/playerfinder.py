@@ -8,6 +8,9 @@ import re
 import json
 import os
 
+from utils.metrics import metrics
+from utils.router import route
+
 GUILD_DDNET       = 252358080522747904
 ROLE_MODERATOR    = 252523225810993153
 ROLE_ADMIN        = 293495272892399616
@@ -275,7 +278,7 @@ class PlayerFinder(commands.Cog):
         else:
             await ctx.send(f"There is currently no player online with the name \"{player_name}\"")
 
-    @commands.Cog.listener()
+    @route(channel=CHAN_PLAYERFINDER)
     async def on_message(self, message):
         if message.author == self.bot.user:
             if len(message.embeds) > 0 and message.id in self.sent_messages:
@@ -286,6 +289,7 @@ class PlayerFinder(commands.Cog):
                     print(f"Error deleting message: {error}")
 
     @tasks.loop(seconds=30)
+    @metrics.timed('task')
     async def find_players(self):
         players = self.load_players()
         server_filter_list = await self.server_filter()
@@ -1,19 +1,33 @@
-from datetime import datetime
+from datetime import date, datetime
 from io import BytesIO
-from typing import Dict, List
+from typing import Any, Dict, List, Tuple
 
 import logging
 import asyncpg
 import discord
-from discord.ext import commands
-from PIL import Image, ImageDraw, ImageFilter, ImageFont
+import numpy as np
+from discord.ext import commands, tasks
+from PIL import Image, ImageDraw
 
+from utils import atlas
+from utils.assets import assets
 from utils.color import clamp_luminance
-from utils.image import auto_font, center, round_rectangle, save
-from utils.misc import executor
+from utils.image import center, filename, map_base, rectangle, round_rectangle, save
+from utils.imagecache import ImageCache
+from utils.layout import fit_font
+from utils.metrics import metrics
+from utils.rowcache import RowCache
+from utils.plot import downsample, hour_counts, merge_labels, step_line
 from utils.text import clean_content, escape_backticks, human_timedelta, plural
 
-DIR = 'data/assets'
+log = logging.getLogger(__name__)
+
+# $map shrinks tiles from 40px until all of them fit in one row, the 11 valid tiles fit at 25px
+TILE_SIZES = range(25, 41)
+
+SUGGESTIONS = 3
+
+CHECKPOINTS = ', '.join(f'cp{i}' for i in range(1, 26))
 
 
 def humanize_points(points: int) -> str:
@@ -26,630 +40,751 @@ def humanize_points(points: int) -> str:
 
         return f'{points}K'
 
+def humanize_time(time: float) -> str:
+    return '%02d:%05.2f' % divmod(abs(time), 60)
 
-class Profile(commands.Cog):
-    def __init__(self, bot: commands.Bot):
-        self.bot = bot
 
-    @executor
-    def generate_profile_image(self, data: asyncpg.Record) -> BytesIO:
-        font_normal = ImageFont.truetype(f'{DIR}/fonts/normal.ttf', 24)
-        font_bold = ImageFont.truetype(f'{DIR}/fonts/bold.ttf', 34)
-        font_big = ImageFont.truetype(f'{DIR}/fonts/bold.ttf', 48)
+def generate_profile_image(data: Dict[str, Any]) -> BytesIO:
+    font_normal = assets.font('normal', 24)
+    font_bold = assets.font('bold', 34)
+    font_big = assets.font('bold', 48)
 
-        now = datetime.utcnow()
-        if data['day'] == now.day and data['month'] == now.month:
-            img = 'birthday'
-            color = (54, 70, 137)
-        else:
-            thresholds = {
-                18000: ('justice_2', (184, 81, 50)),
-                16000: ('back_in_the_days_3', (156, 162, 142)),
-                14000: ('heartcore', (86, 79, 81)),
-                12000: ('aurora', (55, 103, 156)),
-                10000: ('narcissistic', (122, 32, 43)),
-                9000:  ('aim_10', (93, 128, 144)),
-                8000:  ('barren', (196, 172, 140)),
-                7000:  ('back_in_time', (148, 156, 161)),
-                6000:  ('nostalgia', (161, 140, 148)),
-                5000:  ('sweet_shot', (229, 148, 166)),
-                4000:  ('chained', (183, 188, 198)),
-                3000:  ('intothenight', (60, 76, 89)),
-                2000:  ('darkvine', (145, 148, 177)),
-                1000:  ('crimson_woods', (108, 12, 12)),
-                1:     ('kobra_4', (148, 167, 75)),
-                0:     ('stronghold', (156, 188, 220)),
-            }
-
-            img, color = next(e for t, e in thresholds.items() if data['total_points'] >= t)
-
-        base = Image.open(f'{DIR}/profile_backgrounds/{img}.png')
-
-        canv = ImageDraw.Draw(base)
-
-        width, height = base.size
-        outer = 32
-        inner = int(outer / 2)
-        margin = outer + inner
-
-        # draw bg
-        size = (width - outer * 2, height - outer * 2)
-        bg = round_rectangle(size, 12, color=(0, 0, 0, 150))
-        base.alpha_composite(bg, dest=(outer, outer))
-
-        # draw name
-        try:
-            flag = Image.open(f'{DIR}/flags/{data["country"]}.png')
-        except FileNotFoundError:
-            flag = Image.open(f'{DIR}/flags/UNK.png')
+    now = datetime.utcnow()
+    if data['day'] == now.day and data['month'] == now.month:
+        img = 'birthday'
+        color = (54, 70, 137)
+    else:
+        thresholds = {
+            18000: ('justice_2', (184, 81, 50)),
+            16000: ('back_in_the_days_3', (156, 162, 142)),
+            14000: ('heartcore', (86, 79, 81)),
+            12000: ('aurora', (55, 103, 156)),
+            10000: ('narcissistic', (122, 32, 43)),
+            9000:  ('aim_10', (93, 128, 144)),
+            8000:  ('barren', (196, 172, 140)),
+            7000:  ('back_in_time', (148, 156, 161)),
+            6000:  ('nostalgia', (161, 140, 148)),
+            5000:  ('sweet_shot', (229, 148, 166)),
+            4000:  ('chained', (183, 188, 198)),
+            3000:  ('intothenight', (60, 76, 89)),
+            2000:  ('darkvine', (145, 148, 177)),
+            1000:  ('crimson_woods', (108, 12, 12)),
+            1:     ('kobra_4', (148, 167, 75)),
+            0:     ('stronghold', (156, 188, 220)),
+        }
 
-        flag_w, flag_h = flag.size
+        img, color = next(e for t, e in thresholds.items() if data['total_points'] >= t)
 
-        name = ' ' + data['name']
-        w, _ = font_bold.getsize(name)
-        _, h = font_bold.getsize('yA')  # hardcoded to align names
+    base = assets.image(f'profile_backgrounds/{img}.png')
 
-        name_height = 50
-        radius = int(name_height / 2)
+    canv = ImageDraw.Draw(base)
 
-        size = (flag_w + w + radius * 2, name_height)
-        name_bg = round_rectangle(size, radius, color=(150, 150, 150, 75))
-        base.alpha_composite(name_bg, dest=(margin, margin))
+    width, height = base.size
+    outer = 32
+    inner = int(outer / 2)
+    margin = outer + inner
 
-        x = margin + radius
-        dest = (x, margin + center(flag_h, name_height))
-        base.alpha_composite(flag, dest=dest)
+    # draw bg
+    size = (width - outer * 2, height - outer * 2)
+    bg = round_rectangle(size, 12, color=(0, 0, 0, 150))
+    base.alpha_composite(bg, dest=(outer, outer))
 
-        xy = (x + flag_w, margin + center(h, name_height))
-        canv.text(xy, name, fill='white', font=font_bold)
+    # draw name
+    country = data['country'] if data['country'] in atlas.flags else 'UNK'
+    flag_w, flag_h = atlas.flags.size(country)
 
-        # draw points
-        points_width = (width - margin * 2) / 3
+    name = ' ' + data['name']
+    w, _ = font_bold.getsize(name)
+    _, h = font_bold.getsize('yA')  # hardcoded to align names
 
-        x = margin + points_width + inner
-        y = margin + name_height + inner
+    name_height = 50
+    radius = int(name_height / 2)
 
-        xy = ((x, y), (x, height - margin))
-        canv.line(xy, fill='white', width=3)
+    size = (flag_w + w + radius * 2, name_height)
+    name_bg = round_rectangle(size, radius, color=(150, 150, 150, 75))
+    base.alpha_composite(name_bg, dest=(margin, margin))
 
-        text = f'#{data["total_rank"]}'
-        w, h = font_big.getsize(text)
-        xy = (margin + center(w, points_width), y)
-        canv.text(xy, text, fill='white', font=font_big)
+    x = margin + radius
+    dest = (x, margin + center(flag_h, name_height))
+    atlas.flags.draw(base, country, dest)
 
-        offset = h * 0.25  # true drawn height is only 3 / 4
+    xy = (x + flag_w, margin + center(h, name_height))
+    canv.text(xy, name, fill='white', font=font_bold)
 
-        text = str(data['total_points'])
-        w, h = font_bold.getsize(text)
-        suffix = plural(data['total_points'], ' point').upper()
-        w2, h2 = font_normal.getsize(suffix)
+    # draw points
+    points_width = (width - margin * 2) / 3
 
-        x = margin + center(w + w2, points_width)
-        y = height - margin - offset
+    x = margin + points_width + inner
+    y = margin + name_height + inner
 
-        canv.text((x, y - h), text, fill=color, font=font_bold)
-        canv.text((x + w, y - h2), suffix, fill=color, font=font_normal)
+    xy = ((x, y), (x, height - margin))
+    canv.line(xy, fill='white', width=3)
 
-        # draw ranks
-        types = {
-            'TEAM RANK ': (data['team_rank'], data['team_points']),
-            'RANK ': (data['solo_rank'], data['solo_points'])
-        }
+    text = f'#{data["total_rank"]}'
+    w, h = font_big.getsize(text)
+    xy = (margin + center(w, points_width), y)
+    canv.text(xy, text, fill='white', font=font_big)
 
-        _, h = font_bold.getsize('A')
-        yy = (margin + name_height + inner + h * 1.25, height - margin - h * 0.5)
+    offset = h * 0.25  # true drawn height is only 3 / 4
 
-        for (type_, (rank, points)), y in zip(types.items(), yy):
-            line = [(type_, 'white', font_normal)]
-            if rank is None:
-                line.append(('UNRANKED', (150, 150, 150), font_bold))
+    text = str(data['total_points'])
+    w, h = font_bold.getsize(text)
+    suffix = plural(data['total_points'], ' point').upper()
+    w2, h2 = font_normal.getsize(suffix)
+
+    x = margin + center(w + w2, points_width)
+    y = height - margin - offset
+
+    canv.text((x, y - h), text, fill=color, font=font_bold)
+    canv.text((x + w, y - h2), suffix, fill=color, font=font_normal)
+
+    # draw ranks
+    types = {
+        'TEAM RANK ': (data['team_rank'], data['team_points']),
+        'RANK ': (data['solo_rank'], data['solo_points'])
+    }
+
+    _, h = font_bold.getsize('A')
+    yy = (margin + name_height + inner + h * 1.25, height - margin - h * 0.5)
+
+    for (type_, (rank, points)), y in zip(types.items(), yy):
+        line = [(type_, 'white', font_normal)]
+        if rank is None:
+            line.append(('UNRANKED', (150, 150, 150), font_bold))
+        else:
+            line.extend((
+                (f'#{rank}', 'white', font_bold),
+                ('   ', 'white', font_bold),  # border placeholder
+                (str(points), color, font_bold),
+                (plural(points, ' point').upper(), color, font_normal),
+            ))
+
+        x = width - margin
+        for text, color_, font in line[::-1]:
+            w, h = font.getsize(text)
+            x -= w  # adjust x before drawing since we're drawing reverse
+            if text == '   ':
+                xy = ((x + w / 2, y - h * 0.75), (x + w / 2, y - 1))  # fix line width overflow
+                canv.line(xy, fill=color_, width=1)
             else:
-                line.extend((
-                    (f'#{rank}', 'white', font_bold),
-                    ('   ', 'white', font_bold),  # border placeholder
-                    (str(points), color, font_bold),
-                    (plural(points, ' point').upper(), color, font_normal),
-                ))
+                canv.text((x, y - h), text, fill=color_, font=font)
 
+    return save(base.convert('RGB'), 'profile')
+
+def generate_points_image(data: Dict[str, List[Tuple[date, int]]]) -> BytesIO:
+    """`data` maps players to their cumulative points over time, sorted by date"""
+    font_small = assets.font('normal', 16)
+
+    color_light = (100, 100, 100)
+    color_dark = (50, 50, 50)
+    colors = (
+        'orange',
+        'red',
+        'forestgreen',
+        'dodgerblue',
+        'orangered',
+        'orchid',
+        'burlywood',
+        'darkcyan',
+        'royalblue',
+        'olive',
+    )
+
+    base = assets.image('points_background.png')
+    canv = ImageDraw.Draw(base)
+
+    width, height = base.size
+    margin = 50
+
+    plot_width = width - margin * 2
+    plot_height = height - margin * 2
+
+    end_date = datetime.utcnow().date()
+    is_leap = end_date.month == 2 and end_date.month == 29
+    start_date = min(t for d in data.values() for t, _ in d)
+    start_date = min(start_date, end_date.replace(year=end_date.year - 1, day=end_date.day - is_leap))
+
+    total_points = max(d[-1][1] for d in data.values())
+    total_points = max(total_points, 1000)
+
+    days_mult = plot_width / (end_date - start_date).days
+    points_mult = plot_height / total_points
+
+    # draw area bg
+    bg = rectangle((plot_width, plot_height), color=(0, 0, 0, 100))
+    base.alpha_composite(bg, dest=(margin, margin))
+
+    # draw years
+    prev_x = margin
+    for year in range(start_date.year, end_date.year + 2):
+        date = datetime(year=year, month=1, day=1).date()
+        if date < start_date:
+            continue
+
+        if date > end_date:
             x = width - margin
-            for text, color_, font in line[::-1]:
-                w, h = font.getsize(text)
-                x -= w  # adjust x before drawing since we're drawing reverse
-                if text == '   ':
-                    xy = ((x + w / 2, y - h * 0.75), (x + w / 2, y - 1))  # fix line width overflow
-                    canv.line(xy, fill=color_, width=1)
-                else:
-                    canv.text((x, y - h), text, fill=color_, font=font)
+        else:
+            x = margin + (date - start_date).days * days_mult
+            xy = ((x, margin), (x, height - margin))
+            canv.line(xy, fill=color_dark, width=1)
+
+        text = str(year - 1)
+        w, h = font_small.getsize(text)
+        area_width = x - prev_x
+        if w <= area_width:
+            xy = (prev_x + center(w, area_width), height - margin + h)
+            canv.text(xy, text, fill=color_light, font=font_small)
+
+        prev_x = x
+
+    # draw points
+    thresholds = {
+        15000: 5000,
+        10000: 2500,
+        5000:  2000,
+        3000:  1000,
+        1000:  500,
+        0:     250,
+    }
+
+    steps = next(s for t, s in thresholds.items() if total_points > t)
+    w, _ = font_small.getsize('00.0K')  # max points label width
+    points_margin = center(w, margin)
+    for points in range(0, total_points + 1, int(steps / 5)):
+        y = height - margin - points * points_mult
+        xy = ((margin, y), (width - margin - 1, y))
+
+        if points % steps == 0:
+            canv.line(xy, fill=color_light, width=2)
 
-        return save(base.convert('RGB'))
+            text = humanize_points(points)
+            w, h = font_small.getsize(text)
+            xy = (margin - points_margin - w, y + center(h))
+            canv.text(xy, text, fill=color_light, font=font_small)
+        else:
+            canv.line(xy, fill=color_dark, width=1)
+
+    # draw players
+    extra = 2
+    size = (plot_width * 2, (plot_height + extra * 2) * 2)
+    plot = Image.new('RGBA', size, color=(0, 0, 0, 0))
+    plot_canv = ImageDraw.Draw(plot)
+
+    labels = []
+    for dates, color in reversed(list(zip(data.values(), colors))):
+        bottom = (plot_height + extra) * 2
+        days = np.array([(d - start_date).days for d, _ in dates], dtype=float)
+        points = np.array([p for _, p in dates], dtype=float)
+        xy = step_line(days, points, bottom=bottom, x_mult=days_mult * 2, y_mult=points_mult * 2,
+                       end=plot_width * 2, step=plot_width * 2 * 0.1)
+
+        plot_canv.line(downsample(xy, plot_width * 2).ravel().tolist(), fill=color, width=6)
+
+        labels.append((margin - extra + xy[-1, 1] / 2, color))
+
+    size = (plot_width, plot_height + extra * 2)
+    plot = plot.resize(size, resample=Image.LANCZOS, reducing_gap=1.0)  # antialiasing
+    base.alpha_composite(plot, dest=(margin, margin - extra))
+
+    # remove overlapping labels
+    _, h = font_small.getsize('0')
+    offset = center(h)
+    labels = merge_labels(labels, -offset * 2, 'white')
+
+    # draw player points
+    for y, color in labels:
+        points = int((height - margin - y) / points_mult)
+        text = humanize_points(points)
+        xy = (width - margin + points_margin, y + offset)
+        canv.text(xy, text, fill=color, font=font_small)
+
+    # draw header
+    def check(w: int, size: int) -> float:
+        return w + (size / 3) * (4 * len(data) - 2)
+
+    font = fit_font(assets.font('normal', 24), ''.join(data), plot_width, check=check)
+    space = font.size / 3
+
+    x = margin
+    for player, color in zip(data, colors):
+        y = center(space, margin)
+        xy = ((x, y), (x + space, y + space))
+        canv.rectangle(xy, fill=color)
+        x += space * 2
+
+        w, _ = font.getsize(player)
+        _, h = font.getsize('yA')  # max name height, needs to be hardcoded to align names
+        xy = (x, center(h, margin))
+        canv.text(xy, player, fill='white', font=font)
+        x += w + space * 2
+
+    return save(base.convert('RGB'), 'points')
+
+def generate_map_image(data: Dict[str, Any]) -> BytesIO:
+    font_48 = assets.font('normal', 46)
+    font_36 = assets.font('normal', 36)
+    font_32 = assets.font('normal', 32)
+    font_26 = assets.font('normal', 26)
+    font_24 = assets.font('normal', 24)
+    font_22 = assets.font('normal', 22)
+    font_20 = assets.font('normal', 20)
+    font_16 = assets.font('normal', 16)
+
+    name = data['name']
+
+    color = data['color']
+    color = clamp_luminance(color, 0.7)
+
+    try:
+        base = assets.image(f'map_bases/{name}.png')
+    except FileNotFoundError:  # not generated by the releases import yet
+        base = map_base(assets.image(f'map_backgrounds/{name}.png'))
+
+    canv = ImageDraw.Draw(base)
+
+    width, height = base.size
+    outer = 32
+    inner = int(outer / 2)
+    margin = outer + inner
+
+    # draw header
+    mappers = data['mappers']
+
+    name_height = 50
+    radius = int(name_height / 2)
+
+    text = name if mappers is None else f'{name} by {mappers}'
+    font = fit_font(font_36, text, width - margin * 2 - radius * 2)
+    w, _ = font.getsize(text)
+    _, h = font.getsize('yA')
+
+    size = (w + radius * 2, name_height)
+    name_bg = round_rectangle(size, radius, color=(150, 150, 150, 75))
+    base.alpha_composite(name_bg, dest=(margin, margin))
+
+    xy = (margin + radius, margin + center(h, name_height))
+    canv.text(xy, text, fill='white', font=font)
+
+    # draw info
+    server = data['server']
+    points = data['points']
+    finishers = data['finishers']
+    timestamp = data['timestamp']
+
+    info_width = (width - margin * 2) / 2.5
+
+    x = margin + info_width + inner
+    y = margin + name_height + inner
+    xy = ((x, margin + name_height + inner), (x, height - margin))
+    canv.line(xy, fill='white', width=3)  # border
+
+    y += inner
+
+    servers = {
+        'Novice':       (1, 0),
+        'Moderate':     (2, 5),
+        'Brutal':       (3, 15),
+        'Insane':       (4, 30),
+        'Dummy':        (5, 5),
+        'DDmaX':        (4, 0),
+        'Oldschool':    (6, 0),
+        'Solo':         (4, 0),
+        'Race':         (2, 0),
+        'Fun':          (2, 0),
+    }
+
+    mult, offset = servers[server]
+    stars = int((points - offset) / mult)
+
+    lines = (
+        ((server.upper(), 'white', font_32),),
+        (('★' * stars + '☆' * (5 - stars), 'white', font_48),),
+        ((str(points), color, font_26),
+         (plural(points, ' point').upper(), 'white', font_20)),
+        ((str(finishers), color, font_26),
+         (plural(finishers, ' finisher').upper(), 'white', font_20)),
+        (('RELEASED ', 'white', font_16),
+         (timestamp.strftime('%b %d %Y').upper(), color, font_22))
+    )
+
+    for line in lines:
+        sizes = [f.getsize(t) for t, _, f in line]
+        x = margin + center(sum(w for w, _ in sizes), info_width)
+        y += max(h for _, h in sizes)
+        for (text, color_, font), (w, h) in zip(line, sizes):
+            canv.text((x, y - h), text, fill=color_, font=font)
+            x += w
 
-    @commands.command()
-    async def profile(self, ctx: commands.Context, *, player: clean_content=None):
+        y += inner
 
-        player = player or ctx.author.display_name
+    xy = ((margin, y), (margin + info_width, y))
+    canv.line(xy, fill='white', width=3)  # border
+    y += inner
+
+    # draw tiles
+    tiles = data['tiles']
+    if tiles:
+        # TODO: wrap tiles over multiple rows
+        size = min(TILE_SIZES[-1], int(info_width // len(tiles)))
+        x = margin + center(size * len(tiles), info_width)
+        y += center(size, height - margin - y)
+        for tile in tiles:
+            atlas.tiles.draw(base, tile, (x, y), size)
+            x += size
+
+    # draw ranks
+    ranks = data['ranks']
+    if ranks:
+        font = font_24
+
+        time_w, _ = font.getsize(humanize_time(max(t for _, _, t in ranks)))
+        rank_w, _ = font.getsize(f'#{max(r for _, r, _ in ranks)}')
+        _, h = font.getsize('yA')
 
-        query = """SELECT * FROM stats_players
-                   INNER JOIN stats_birthdays ON stats_players.name = stats_birthdays.name
-                   WHERE stats_players.name = $1;
-                """
+        y = margin + name_height + inner
+        space = (height - margin - y - h * 10) / 11
+        for player, rank, time in ranks:
+            y += space
+            x = margin + info_width + inner * 2
+            canv.text((x, y), f'#{rank}', fill='white', font=font)
+            x += rank_w + inner
+
+            x += time_w
+            text = humanize_time(time)
+            w, _ = font.getsize(text)
+            canv.text((x - w, y), text, fill=color, font=font)
+            x += inner
+
+            _, h_org = font.getsize(player)
+            font_player = fit_font(font, player, width - margin - x)
+            _, h_new = font_player.getsize(player)
+            canv.text((x, y - center(h_org - h_new)), player, fill='white', font=font_player)
+            y += h
+
+    return save(base.convert('RGB'), 'map')
+
+def generate_hours_image(data: Dict[str, List[Tuple[int, int]]]) -> BytesIO:
+    font_small = assets.font('normal', 16)
+
+    color_light = (100, 100, 100)
+    colors = (
+        'orange',
+        'red',
+        'forestgreen',
+        'dodgerblue',
+        'orangered',
+        'orchid',
+        'burlywood',
+        'darkcyan',
+        'royalblue',
+        'olive',
+    )
+
+    base = assets.image('hours_background.png')
+    canv = ImageDraw.Draw(base)
+
+    width, height = base.size
+    margin = 50
+
+    plot_width = width - margin * 2
+    plot_height = height - margin * 2
+
+    # draw area bg
+    bg = rectangle((plot_width, plot_height), color=(0, 0, 0, 100))
+    base.alpha_composite(bg, dest=(margin, margin))
+
+    # draw hours
+    x = margin
+    y = height - margin
+    hour_width = plot_width / 24
+    now = datetime.utcnow()
+    for hour in range(25):
+        xy = ((x, margin), (x, y - 1))  # fix overflow
+        canv.line(xy, fill=color_light, width=1)
+
+        if 0 <= hour <= 23:
+            text = str(hour)
+            w, h = font_small.getsize(text)
+            xy = (x + center(w, hour_width), y + h)
+            color = 'green' if hour == now.hour else color_light
+            canv.text(xy, text, fill=color, font=font_small)
 
-        record = await self.bot.pool.fetchrow(query, player)
-        if not record:
-            return await ctx.send('Could not find that player')
+        x += hour_width
 
-        buf = await self.generate_profile_image(record)
-        file = discord.File(buf, filename=f'profile_{player}.png')
-        await ctx.send(file=file)
+    # draw players
+    extra = 2
+    size = (plot_width * 2, (plot_height + extra * 2) * 2)
+    plot = Image.new('RGBA', size, color=(0, 0, 0, 0))
+    plot_canv = ImageDraw.Draw(plot)
 
-    @executor
-    def generate_points_image(self, data: Dict[str, List[asyncpg.Record]]) -> BytesIO:
-        font_small = ImageFont.truetype(f'{DIR}/fonts/normal.ttf', 16)
-
-        color_light = (100, 100, 100)
-        color_dark = (50, 50, 50)
-        colors = (
-            'orange',
-            'red',
-            'forestgreen',
-            'dodgerblue',
-            'orangered',
-            'orchid',
-            'burlywood',
-            'darkcyan',
-            'royalblue',
-            'olive',
-        )
-
-        base = Image.open(f'{DIR}/points_background.png')
-        canv = ImageDraw.Draw(base)
-
-        width, height = base.size
-        margin = 50
-
-        plot_width = width - margin * 2
-        plot_height = height - margin * 2
-
-        end_date = datetime.utcnow().date()
-        is_leap = end_date.month == 2 and end_date.month == 29
-        start_date = min(r['timestamp'] for d in data.values() for r in d)
-        start_date = min(start_date, end_date.replace(year=end_date.year - 1, day=end_date.day - is_leap))
-
-        total_points = max(sum(r['points'] for r in d) for d in data.values())
-        total_points = max(total_points, 1000)
-
-        days_mult = plot_width / (end_date - start_date).days
-        points_mult = plot_height / total_points
-
-        # draw area bg
-        bg = Image.new('RGBA', (plot_width, plot_height), color=(0, 0, 0, 100))
-        base.alpha_composite(bg, dest=(margin, margin))
-
-        # draw years
-        prev_x = margin
-        for year in range(start_date.year, end_date.year + 2):
-            date = datetime(year=year, month=1, day=1).date()
-            if date < start_date:
-                continue
-
-            if date > end_date:
-                x = width - margin
-            else:
-                x = margin + (date - start_date).days * days_mult
-                xy = ((x, margin), (x, height - margin))
-                canv.line(xy, fill=color_dark, width=1)
+    for hours, color in reversed(list(zip(data.values(), colors))):
+        hours = hour_counts(hours)
+        ys = (plot_height * 2 * (1 - hours / hours.max()) + extra).tolist()
+        xs = (np.arange(1, 25) * hour_width * 2 - hour_width).tolist()
 
-            text = str(year - 1)
-            w, h = font_small.getsize(text)
-            area_width = x - prev_x
-            if w <= area_width:
-                xy = (prev_x + center(w, area_width), height - margin + h)
-                canv.text(xy, text, fill=color_light, font=font_small)
+        for x, y in zip(xs, ys):
+            rect_xy = ((x - 5, y - 5), (x + 5, y + 5))
+            plot_canv.rectangle(rect_xy, fill=color)
 
-            prev_x = x
+        xy = [(-hour_width, ys[-1]), *zip(xs, ys), (xs[-1] + hour_width * 2, ys[0])]
+        plot_canv.line(xy, fill=color, width=6)
 
-        # draw points
-        thresholds = {
-            15000: 5000,
-            10000: 2500,
-            5000:  2000,
-            3000:  1000,
-            1000:  500,
-            0:     250,
-        }
+    size = (plot_width, plot_height + extra * 2)
+    plot = plot.resize(size, resample=Image.LANCZOS, reducing_gap=1.0)  # antialiasing
+    base.alpha_composite(plot, dest=(margin, margin - extra))
 
-        steps = next(s for t, s in thresholds.items() if total_points > t)
-        w, _ = font_small.getsize('00.0K')  # max points label width
-        points_margin = center(w, margin)
-        for points in range(0, total_points + 1, int(steps / 5)):
-            y = height - margin - points * points_mult
-            xy = ((margin, y), (width - margin - 1, y))
+    # draw header
+    def check(w: int, size: int) -> int:
+        return w + (size / 3) * (4 * len(data) - 2)
 
-            if points % steps == 0:
-                canv.line(xy, fill=color_light, width=2)
+    font = fit_font(assets.font('normal', 24), ''.join(data), plot_width, check=check)
+    space = font.size / 3
 
-                text = humanize_points(points)
-                w, h = font_small.getsize(text)
-                xy = (margin - points_margin - w, y + center(h))
-                canv.text(xy, text, fill=color_light, font=font_small)
-            else:
-                canv.line(xy, fill=color_dark, width=1)
-
-        # draw players
-        extra = 2
-        size = (plot_width * 2, (plot_height + extra * 2) * 2)
-        plot = Image.new('RGBA', size, color=(0, 0, 0, 0))
-        plot_canv = ImageDraw.Draw(plot)
-
-        labels = []
-        for dates, color in reversed(list(zip(data.values(), colors))):
-            x = 0
-            y = (plot_height + extra) * 2
-            xy = [(x, y)]
-
-            prev_date = start_date
-            for date, points in dates:
-                delta = (date - prev_date).days * days_mult * 2
-                x += delta
-                if delta / (plot_width * 2) > 0.1:
-                    xy.append((x, y))
-
-                y -= points * points_mult * 2
-                xy.append((x, y))
-
-                prev_date = date
-
-            if prev_date != end_date:
-                xy.append((plot_width * 2, y))
-
-            plot_canv.line(xy, fill=color, width=6)
-
-            labels.append((margin - extra + y / 2, color))
-
-        size = (plot_width, plot_height + extra * 2)
-        plot = plot.resize(size, resample=Image.LANCZOS, reducing_gap=1.0)  # antialiasing
-        base.alpha_composite(plot, dest=(margin, margin - extra))
-
-        # remove overlapping labels TODO: optimize
-        _, h = font_small.getsize('0')
-        offset = center(h)
-        for _ in range(len(labels)):
-            labels.sort()
-            for i, (y1, _) in enumerate(labels):
-                if i == len(labels) - 1:
-                    break
-
-                y2 = labels[i + 1][0]
-                if y1 - offset >= y2 + offset and y2 - offset >= y1 + offset:
-                    labels[i] = ((y1 + y2) / 2, 'white')
-                    del labels[i + 1]
-
-        # draw player points
-        for y, color in labels:
-            points = int((height - margin - y) / points_mult)
-            text = humanize_points(points)
-            xy = (width - margin + points_margin, y + offset)
-            canv.text(xy, text, fill=color, font=font_small)
+    x = margin
+    _, h = font.getsize('yA')  # max name height, needs to be hardcoded to align names
+    for player, color in zip(data, colors):
+        y = center(space, margin)
+        xy = ((x, y), (x + space, y + space))
+        canv.rectangle(xy, fill=color)
+        x += space * 2
 
-        # draw header
-        def check(w: int, size: int) -> float:
-            return w + (size / 3) * (4 * len(data) - 2)
+        w, _ = font.getsize(player)
+        xy = (x, center(h, margin))
+        canv.text(xy, player, fill='white', font=font)
+        x += w + space * 2
 
-        font = auto_font((f'{DIR}/fonts/normal.ttf', 24), ''.join(data), plot_width, check=check)
-        space = font.size / 3
+    return save(base.convert('RGB'), 'hours')
 
-        x = margin
-        for player, color in zip(data, colors):
-            y = center(space, margin)
-            xy = ((x, y), (x + space, y + space))
-            canv.rectangle(xy, fill=color)
-            x += space * 2
+def generate_splits_image(data: Dict[str, List[float]], checkpoints: List[int]) -> BytesIO:
+    """`data` holds the time of two players at each of the `checkpoints` they both passed plus their finish time"""
+    font_small = assets.font('normal', 16)
 
-            w, _ = font.getsize(player)
-            _, h = font.getsize('yA')  # max name height, needs to be hardcoded to align names
-            xy = (x, center(h, margin))
-            canv.text(xy, player, fill='white', font=font)
-            x += w + space * 2
+    color_light = (100, 100, 100)
+    colors = ('orange', 'dodgerblue')
 
-        return save(base.convert('RGB'))
+    base = assets.image('hours_background.png')
+    canv = ImageDraw.Draw(base)
 
-    @commands.command()
-    async def points(self, ctx: commands.Context, *players: clean_content):
+    width, height = base.size
+    margin = 50
 
-        players = [p for p in players if p] or [ctx.author.display_name]
-        if len(players) > 10:
-            return await ctx.send('Can at most compare 10 players')
+    plot_width = width - margin * 2
+    plot_height = height - margin * 2
 
-        data = {}
-        query = 'SELECT timestamp, points FROM stats_finishes WHERE name = $1 ORDER BY timestamp;'
-        for player in players:
-            if player in data:
-                continue
+    # draw area bg
+    bg = rectangle((plot_width, plot_height), color=(0, 0, 0, 100))
+    base.alpha_composite(bg, dest=(margin, margin))
 
-            records = await self.bot.pool.fetch(query, player)
-            if not records:
-                return await ctx.send(f'Could not find player ``{escape_backticks(player)}``')
+    # positive deltas mean the first player is ahead
+    times = np.array(list(data.values()))
+    deltas = times[1] - times[0]
+    splits = np.diff(times, prepend=0)
+    split_deltas = splits[1] - splits[0]
 
-            data[player] = records
-        buf = await self.generate_points_image(data)
-        file = discord.File(buf, filename=f'points_{"_".join(players)}.png')
-        await ctx.send(file=file)
+    limit = max(np.abs(deltas).max(), np.abs(split_deltas).max(), 0.01)
+    middle = margin + plot_height / 2
+    mult = (plot_height / 2 - 10) / limit
 
-    @points.error
-    async def points_error(self, ctx: commands.Context, error: commands.CommandError):
-        if isinstance(error, commands.ArgumentParsingError):
-            await ctx.send('<players> contain unmatched or unescaped quotation mark')
+    # draw checkpoints
+    cp_width = plot_width / len(deltas)
+    x = margin
+    y = height - margin
+    for i in range(len(deltas) + 1):
+        xy = ((x, margin), (x, y - 1))  # fix overflow
+        canv.line(xy, fill=color_light, width=1)
 
-    @executor
-    def generate_map_image(self, data: asyncpg.Record) -> BytesIO:
-        font_48 = ImageFont.truetype(f'{DIR}/fonts/normal.ttf', 46)
-        font_36 = ImageFont.truetype(f'{DIR}/fonts/normal.ttf', 36)
-        font_32 = ImageFont.truetype(f'{DIR}/fonts/normal.ttf', 32)
-        font_26 = ImageFont.truetype(f'{DIR}/fonts/normal.ttf', 26)
-        font_24 = ImageFont.truetype(f'{DIR}/fonts/normal.ttf', 24)
-        font_22 = ImageFont.truetype(f'{DIR}/fonts/normal.ttf', 22)
-        font_20 = ImageFont.truetype(f'{DIR}/fonts/normal.ttf', 20)
-        font_16 = ImageFont.truetype(f'{DIR}/fonts/normal.ttf', 16)
-
-        name = data['name']
-
-        color = data['color']
-        color = clamp_luminance(color, 0.7)
-
-        base = Image.open(f'{DIR}/map_backgrounds/{name}.png')
-        base = base.filter(ImageFilter.GaussianBlur(radius=3))
-        canv = ImageDraw.Draw(base)
-
-        width, height = base.size
-        outer = 32
-        inner = int(outer / 2)
-        margin = outer + inner
-
-        # draw bg
-        size = (width - outer * 2, height - outer * 2)
-        bg = round_rectangle(size, 12, color=(0, 0, 0, 175))
-        base.alpha_composite(bg, dest=(outer, outer))
-
-        # draw header
-        mappers = data['mappers']
-
-        name_height = 50
-        radius = int(name_height / 2)
-
-        text = name if mappers is None else f'{name} by {mappers}'
-        font = auto_font(font_36, text, width - margin * 2 - radius * 2)
-        w, _ = font.getsize(text)
-        _, h = font.getsize('yA')
+        if i < len(deltas):
+            text = 'F' if i == len(deltas) - 1 else str(checkpoints[i])
+            w, h = font_small.getsize(text)
+            xy = (x + center(w, cp_width), y + h)
+            canv.text(xy, text, fill=color_light, font=font_small)
 
-        size = (w + radius * 2, name_height)
-        name_bg = round_rectangle(size, radius, color=(150, 150, 150, 75))
-        base.alpha_composite(name_bg, dest=(margin, margin))
+        x += cp_width
 
-        xy = (margin + radius, margin + center(h, name_height))
-        canv.text(xy, text, fill='white', font=font)
+    xy = ((margin, middle), (width - margin - 1, middle))
+    canv.line(xy, fill=color_light, width=2)
 
-        # draw info
-        server = data['server']
-        points = data['points']
-        finishers = data['finishers']
-        timestamp = data['timestamp']
+    for y, text in ((margin + 10, f'+{limit:.2f}'), (middle, '0'), (height - margin - 10, f'-{limit:.2f}')):
+        w, h = font_small.getsize(text)
+        canv.text((margin - w - 5, y + center(h)), text, fill=color_light, font=font_small)
 
-        info_width = (width - margin * 2) / 2.5
+    # draw time won or lost per split as bars, colored by who was faster
+    for i, delta in enumerate(split_deltas.tolist()):
+        x = margin + i * cp_width
+        top, bottom = sorted((middle, middle - delta * mult))
+        xy = ((x + cp_width / 4, top), (x + cp_width * 3 / 4, bottom))
+        canv.rectangle(xy, fill=colors[0] if delta > 0 else colors[1])
 
-        x = margin + info_width + inner
-        y = margin + name_height + inner
-        xy = ((x, margin + name_height + inner), (x, height - margin))
-        canv.line(xy, fill='white', width=3)  # border
+    # draw the running difference
+    xs = (margin + (np.arange(len(deltas)) + 0.5) * cp_width).tolist()
+    ys = (middle - deltas * mult).tolist()
+    canv.line([(margin, middle), *zip(xs, ys)], fill='white', width=3)
+    for x, y in zip(xs, ys):
+        canv.ellipse(((x - 4, y - 4), (x + 4, y + 4)), fill='white')
 
-        y += inner
+    # draw header
+    labels = [f'{p} {humanize_time(t[-1])}' for p, t in data.items()]
 
-        servers = {
-            'Novice':       (1, 0),
-            'Moderate':     (2, 5),
-            'Brutal':       (3, 15),
-            'Insane':       (4, 30),
-            'Dummy':        (5, 5),
-            'DDmaX':        (4, 0),
-            'Oldschool':    (6, 0),
-            'Solo':         (4, 0),
-            'Race':         (2, 0),
-            'Fun':          (2, 0),
-        }
+    def check(w: int, size: int) -> int:
+        return w + (size / 3) * (4 * len(labels) - 2)
 
-        mult, offset = servers[server]
-        stars = int((points - offset) / mult)
-
-        lines = (
-            ((server.upper(), 'white', font_32),),
-            (('★' * stars + '☆' * (5 - stars), 'white', font_48),),
-            ((str(points), color, font_26),
-             (plural(points, ' point').upper(), 'white', font_20)),
-            ((str(finishers), color, font_26),
-             (plural(finishers, ' finisher').upper(), 'white', font_20)),
-            (('RELEASED ', 'white', font_16),
-             (timestamp.strftime('%b %d %Y').upper(), color, font_22))
-        )
-
-        for line in lines:
-            sizes = [f.getsize(t) for t, _, f in line]
-            x = margin + center(sum(w for w, _ in sizes), info_width)
-            y += max(h for _, h in sizes)
-            for (text, color_, font), (w, h) in zip(line, sizes):
-                canv.text((x, y - h), text, fill=color_, font=font)
-                x += w
+    font = fit_font(assets.font('normal', 24), ''.join(labels), plot_width, check=check)
+    space = font.size / 3
 
-            y += inner
+    x = margin
+    _, h = font.getsize('yA')  # max name height, needs to be hardcoded to align names
+    for label, color in zip(labels, colors):
+        y = center(space, margin)
+        xy = ((x, y), (x + space, y + space))
+        canv.rectangle(xy, fill=color)
+        x += space * 2
 
-        xy = ((margin, y), (margin + info_width, y))
-        canv.line(xy, fill='white', width=3)  # border
-        y += inner
+        w, _ = font.getsize(label)
+        xy = (x, center(h, margin))
+        canv.text(xy, label, fill='white', font=font)
+        x += w + space * 2
 
-        # draw tiles
-        tiles = data['tiles']
-        if tiles:
-            # TODO: wrap tiles over multiple rows
-            size = 40
-            while size * len(tiles) > info_width:
-                size -= 1
-
-            x = margin + center(size * len(tiles), info_width)
-            y += center(size, height - margin - y)
-            for tile in tiles:
-                tile = Image.open(f'{DIR}/tiles/{tile}.png').resize((size, size))
-                base.alpha_composite(tile, dest=(x, y))
-                x += size
-
-        # draw ranks
-        ranks = data['ranks']
-        if ranks:
-            font = font_24
-
-            def humanize_time(time):
-                return '%02d:%05.2f' % divmod(abs(time), 60)
-
-            time_w, _ = font.getsize(humanize_time(max(r['time'] for r in ranks)))
-            rank_w, _ = font.getsize(f'#{max(r["rank"] for r in ranks)}')
-            _, h = font.getsize('yA')
-
-            y = margin + name_height + inner
-            space = (height - margin - y - h * 10) / 11
-            for player, rank, time in ranks:
-                y += space
-                x = margin + info_width + inner * 2
-                canv.text((x, y), f'#{rank}', fill='white', font=font)
-                x += rank_w + inner
-
-                x += time_w
-                text = humanize_time(time)
-                w, _ = font.getsize(text)
-                canv.text((x - w, y), text, fill=color, font=font)
-                x += inner
-
-                _, h_org = font.getsize(player)
-                font_player = auto_font(font, player, width - margin - x)
-                _, h_new = font_player.getsize(player)
-                canv.text((x, y - center(h_org - h_new)), player, fill='white', font=font_player)
-                y += h
-
-        return save(base.convert('RGB'))
+    return save(base.convert('RGB'), 'splits')
 
-    @commands.command()
-    async def map(self, ctx: commands.Context, *, name: clean_content):
 
-        query = """SELECT * FROM stats_maps_static
-                   INNER JOIN stats_maps ON stats_maps_static.name = stats_maps.name
-                   WHERE stats_maps_static.name = $1;
-                """
+def group_by_player(players: List[str], records: List[asyncpg.Record]) -> Dict[str, List[Tuple]]:
+    """Split rows of `(name, *values)` into per player lists of value tuples, in the order of `players`"""
+    rows = {}
+    for name, *values in records:
+        rows.setdefault(name, []).append(tuple(values))
 
-        record = await self.bot.pool.fetchrow(query, name)
-        if not record:
-            return await ctx.send('Could not find that map')
+    return {p: rows[p] for p in players if p in rows}
 
-        buf = await self.generate_map_image(record)
-        file = discord.File(buf, filename=f'map_{name}.png')
-        await ctx.send(file=file)
 
-    @executor
-    def generate_hours_image(self, data: Dict[str, List[asyncpg.Record]]) -> BytesIO:
-        font_small = ImageFont.truetype(f'{DIR}/fonts/normal.ttf', 16)
-
-        color_light = (100, 100, 100)
-        colors = (
-            'orange',
-            'red',
-            'forestgreen',
-            'dodgerblue',
-            'orangered',
-            'orchid',
-            'burlywood',
-            'darkcyan',
-            'royalblue',
-            'olive',
-        )
-
-        base = Image.open(f'{DIR}/hours_background.png')
-        canv = ImageDraw.Draw(base)
-
-        width, height = base.size
-        margin = 50
-
-        plot_width = width - margin * 2
-        plot_height = height - margin * 2
-
-        # draw area bg
-        bg = Image.new('RGBA', (plot_width, plot_height), color=(0, 0, 0, 100))
-        base.alpha_composite(bg, dest=(margin, margin))
-
-        # draw hours
-        x = margin
-        y = height - margin
-        hour_width = plot_width / 24
-        now = datetime.utcnow()
-        for hour in range(25):
-            xy = ((x, margin), (x, y - 1))  # fix overflow
-            canv.line(xy, fill=color_light, width=1)
+def preload():
+    files = ('points_background.png', 'hours_background.png')
+    assets.preload(dirs=('profile_backgrounds',), files=files)
+    atlas.flags.preload()
+    atlas.tiles.preload(TILE_SIZES)
 
-            if 0 <= hour <= 23:
-                text = str(hour)
-                w, h = font_small.getsize(text)
-                xy = (x + center(w, hour_width), y + h)
-                color = 'green' if hour == now.hour else color_light
-                canv.text(xy, text, fill=color, font=font_small)
 
-            x += hour_width
+class Profile(commands.Cog):
+    def __init__(self, bot: commands.Bot):
+        self.bot = bot
+        self.image_cache = ImageCache('data/cache/images')
+        self.row_cache = RowCache()
 
-        # draw players
-        extra = 2
-        size = (plot_width * 2, (plot_height + extra * 2) * 2)
-        plot = Image.new('RGBA', size, color=(0, 0, 0, 0))
-        plot_canv = ImageDraw.Draw(plot)
+    def cog_load(self):
+        self.check_generation.start()
 
-        for hours, color in reversed(list(zip(data.values(), colors))):
-            hours = [
-                next((h['finishes'] for h in hours if h['hour'] == i), 0)
-                for i in range(24)
-            ]
+    def cog_unload(self):
+        self.check_generation.cancel()
 
-            mult = lambda f: plot_height * 2 * (1 - f / max(hours)) + extra
+    @tasks.loop(minutes=1)
+    @metrics.timed('task')
+    async def check_generation(self):
+        try:
+            generation = await self.bot.pool.fetchval('SELECT generation FROM stats_generation;')
+        except (OSError, asyncpg.PostgresError, asyncpg.InterfaceError) as exc:
+            # tasks.loop stops for good on anything it doesn't retry itself, the caches would never be dropped again
+            log.warning('Could not check the stats generation: %s', exc)
+            return
+
+        if generation is not None:
+            self.row_cache.set_generation(generation)
+            await self.image_cache.set_generation(generation)
+
+    async def did_you_mean(self, msg: str, table: str, name: str) -> str:
+        """Append the closest names from `table` to `msg`, using the trigram index on its name column"""
+        query = f"""SELECT name FROM {table} WHERE name % $1
+                    ORDER BY similarity(name, $1) DESC, name LIMIT {SUGGESTIONS};
+                 """
+        try:
+            records = await self.row_cache.get(('suggest', table, name), lambda: self.bot.pool.fetch(query, name))
+        except asyncpg.PostgresError as exc:
+            # pg_trgm has to be installed by hand on databases created before it was added to the schema
+            log.warning('Could not look up names similar to %r in %s: %s', name, table, exc)
+            return msg
 
-            x = -hour_width
-            xy = [(x, mult(hours[-1]))]
-            for finishes in hours:
-                x += hour_width * 2
-                y = mult(finishes)
+        if not records:
+            return msg
 
-                rect_xy = ((x - 5, y - 5), (x + 5, y + 5))
-                plot_canv.rectangle(rect_xy, fill=color)
+        return f'{msg}. Did you mean ' + ', '.join(f'``{escape_backticks(r["name"])}``' for r in records) + '?'
 
-                xy.append((x, y))
+    @commands.command()
+    async def profile(self, ctx: commands.Context, *, player: clean_content=None):
 
-            xy.append((x + hour_width * 2, mult(hours[0])))
-            plot_canv.line(xy, fill=color, width=6)
+        player = player or ctx.author.display_name
 
-        size = (plot_width, plot_height + extra * 2)
-        plot = plot.resize(size, resample=Image.LANCZOS, reducing_gap=1.0)  # antialiasing
-        base.alpha_composite(plot, dest=(margin, margin - extra))
+        key = ('profile', player, datetime.utcnow().date())  # the birthday background depends on the date
+        generation = self.image_cache.generation
+        buf = await self.image_cache.get(key)
+        if buf is None:
+            query = """SELECT * FROM stats_players
+                       INNER JOIN stats_birthdays ON stats_players.name = stats_birthdays.name
+                       WHERE stats_players.name = $1;
+                    """
 
-        # draw header
-        def check(w: int, size: int) -> int:
-            return w + (size / 3) * (4 * len(data) - 2)
+            record = await self.row_cache.get(('player', player), lambda: self.bot.pool.fetchrow(query, player))
+            if not record:
+                return await ctx.send(await self.did_you_mean('Could not find that player', 'stats_players', player))
 
-        font = auto_font((f'{DIR}/fonts/normal.ttf', 24), ''.join(data), plot_width, check=check)
-        space = font.size / 3
+            buf = await self.bot.renderer.render(generate_profile_image, dict(record))
+            await self.image_cache.put(key, buf, generation)
 
-        x = margin
-        _, h = font.getsize('yA')  # max name height, needs to be hardcoded to align names
-        for player, color in zip(data, colors):
-            y = center(space, margin)
-            xy = ((x, y), (x + space, y + space))
-            canv.rectangle(xy, fill=color)
-            x += space * 2
+        file = discord.File(buf, filename=filename(f'profile_{player}', buf))
+        await ctx.send(file=file)
+
+    @commands.command()
+    async def points(self, ctx: commands.Context, *players: clean_content):
+
+        players = [p for p in players if p] or [ctx.author.display_name]
+        if len(players) > 10:
+            return await ctx.send('Can at most compare 10 players')
+
+        key = ('points', tuple(players), datetime.utcnow().date())
+        generation = self.image_cache.generation
+        buf = await self.image_cache.get(key)
+        if buf is None:
+            query = 'SELECT name, timestamp, points FROM stats_points_series WHERE name = ANY($1) ORDER BY timestamp;'
+            records = await self.bot.pool.fetch(query, list(set(players)))
 
-            w, _ = font.getsize(player)
-            xy = (x, center(h, margin))
-            canv.text(xy, player, fill='white', font=font)
-            x += w + space * 2
+            data = group_by_player(players, records)
+            missing = next((p for p in players if p not in data), None)
+            if missing is not None:
+                msg = f'Could not find player ``{escape_backticks(missing)}``'
+                return await ctx.send(await self.did_you_mean(msg, 'stats_players', missing))
 
-        return save(base.convert('RGB'))
+            buf = await self.bot.renderer.render(generate_points_image, data)
+            await self.image_cache.put(key, buf, generation)
+
+        file = discord.File(buf, filename=filename(f'points_{"_".join(players)}', buf))
+        await ctx.send(file=file)
+
+    @points.error
+    async def points_error(self, ctx: commands.Context, error: commands.CommandError):
+        if isinstance(error, commands.ArgumentParsingError):
+            await ctx.send('<players> contain unmatched or unescaped quotation mark')
+
+    @commands.command()
+    async def map(self, ctx: commands.Context, *, name: clean_content):
+
+        key = ('map', name)
+        generation = self.image_cache.generation
+        buf = await self.image_cache.get(key)
+        if buf is None:
+            query = """SELECT * FROM stats_maps_static
+                       INNER JOIN stats_maps ON stats_maps_static.name = stats_maps.name
+                       WHERE stats_maps_static.name = $1;
+                    """
+
+            record = await self.row_cache.get(('map', name), lambda: self.bot.pool.fetchrow(query, name))
+            if not record:
+                return await ctx.send(await self.did_you_mean('Could not find that map', 'stats_maps_static', name))
+
+            data = dict(record)
+            data['ranks'] = [tuple(r) for r in data['ranks']]
+
+            buf = await self.bot.renderer.render(generate_map_image, data)
+            await self.image_cache.put(key, buf, generation)
+
+        file = discord.File(buf, filename=filename(f'map_{name}', buf))
+        await ctx.send(file=file)
 
     @commands.command()
     async def hours(self, ctx: commands.Context, *players: clean_content):
@@ -661,20 +796,24 @@ class Profile(commands.Cog):
         if len(players) > 10:
             return await ctx.send('Can at most compare 10 players')
 
-        data = {}
-        query = 'SELECT hour, finishes FROM stats_hours WHERE name = $1;'
-        for player in players:
-            if player in data:
-                continue
-
-            records = await self.bot.pool.fetch(query, player)
-            if not records:
-                return await ctx.send(f'Could not find player ``{escape_backticks(player)}``')
-
-            data[player] = records
-
-        buf = await self.generate_hours_image(data)
-        file = discord.File(buf, filename=f'hours_{"_".join(players)}.png')
+        now = datetime.utcnow()
+        key = ('hours', tuple(players), now.date(), now.hour)  # the current hour is highlighted
+        generation = self.image_cache.generation
+        buf = await self.image_cache.get(key)
+        if buf is None:
+            query = 'SELECT name, hour, finishes FROM stats_hours WHERE name = ANY($1);'
+            records = await self.bot.pool.fetch(query, list(set(players)))
+
+            data = group_by_player(players, records)
+            missing = next((p for p in players if p not in data), None)
+            if missing is not None:
+                msg = f'Could not find player ``{escape_backticks(missing)}``'
+                return await ctx.send(await self.did_you_mean(msg, 'stats_players', missing))
+
+            buf = await self.bot.renderer.render(generate_hours_image, data)
+            await self.image_cache.put(key, buf, generation)
+
+        file = discord.File(buf, filename=filename(f'hours_{"_".join(players)}', buf))
         await ctx.send(file=file)
 
     @hours.error
@@ -682,15 +821,58 @@ class Profile(commands.Cog):
         if isinstance(error, commands.ArgumentParsingError):
             await ctx.send('<players> contain unmatched or unescaped quotation mark')
 
+    @commands.command()
+    async def splits(self, ctx: commands.Context, map_name: clean_content, *players: clean_content):
+        """Compare the checkpoint times of the best runs of two players on a map.
+           Usage: "<map>" <player> [player], compares against yourself if only one player is given.
+        """
+
+        players = [p for p in players if p]
+        if len(players) == 1:
+            players.insert(0, ctx.author.display_name)
+        if len(players) != 2 or players[0] == players[1]:
+            return await ctx.send('Need two different players to compare')
+
+        key = ('splits', map_name, tuple(players))
+        generation = self.image_cache.generation
+        buf = await self.image_cache.get(key)
+        if buf is None:
+            query = f"""SELECT DISTINCT ON (name) name, time, {CHECKPOINTS} FROM record_race
+                       WHERE map = $1 AND name = ANY($2) ORDER BY name, time;
+                    """
+            records = await self.bot.pool.fetch(query, map_name, players)
+
+            runs = {r['name']: r for r in records}
+            missing = next((p for p in players if p not in runs), None)
+            if missing is not None:
+                return await ctx.send(f'``{escape_backticks(missing)}`` has no finish on that map')
+
+            # older runs can lack checkpoints, only compare the ones both runs have
+            cps = [i for i in range(1, 26) if all(runs[p][f'cp{i}'] for p in players)]
+            data = {p: [runs[p][f'cp{i}'] for i in cps] + [runs[p]['time']] for p in players}
+
+            buf = await self.bot.renderer.render(generate_splits_image, data, cps)
+            await self.image_cache.put(key, buf, generation)
+
+        file = discord.File(buf, filename=filename(f'splits_{"_".join(players)}', buf))
+        await ctx.send(file=file)
+
+    @splits.error
+    async def splits_error(self, ctx: commands.Context, error: commands.CommandError):
+        if isinstance(error, commands.MissingRequiredArgument):
+            await ctx.send('Usage: $splits "<map>" <player> [player]')
+        elif isinstance(error, commands.ArgumentParsingError):
+            await ctx.send('<players> contain unmatched or unescaped quotation mark')
+
     @commands.command()
     async def total_time(self, ctx: commands.Context, *, player: clean_content=None):
         """Show the combined time of all finishes by a player"""
         player = player or ctx.author.display_name
 
         query = 'SELECT time FROM stats_times WHERE name = $1;'
-        time = await self.bot.pool.fetchval(query, player)
+        time = await self.row_cache.get(('time', player), lambda: self.bot.pool.fetchval(query, player))
         if time is None:
-            return await ctx.send('Could not find that player')
+            return await ctx.send(await self.did_you_mean('Could not find that player', 'stats_players', player))
 
         await ctx.send(f'Total time for ``{escape_backticks(player)}``: **{human_timedelta(time)}**')
 
@@ -4,17 +4,16 @@
 import discord
 from discord.ext import commands
 
+from utils.router import route
+
 WH_RECORDS = 338945741714227201
 
 class Records(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
 
-    @commands.Cog.listener()
+    @route(webhook=WH_RECORDS)
     async def on_message(self, message: discord.Message):
-        if message.webhook_id != WH_RECORDS:
-            return
-
         query = 'SELECT id, token FROM records_webhooks;'
         webhooks = await self.bot.pool.fetch(query)
 
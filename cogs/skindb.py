@@ -4,8 +4,11 @@ import re
 import logging
 import asyncio
 from io import BytesIO
+from typing import List
 from PIL import Image, ImageOps
 
+from utils.router import route
+
 GUILD_DDNET       = 252358080522747904
 CHAN_SKIN_SUBMIT  = 985717921600929872
 CHAN_SKIN_INFO    = 985554143525601350
@@ -200,13 +203,41 @@ def crop_and_generate_image(img):
     return tee_images
 
 
+def generate_preview(attachments: List[bytes]) -> BytesIO:
+    images = [Image.open(BytesIO(b)) for b in attachments]
+
+    image_to_process = None
+    for img in images:
+        if img.size == (256, 128):
+            image_to_process = img
+            break
+
+    processed_images = crop_and_generate_image(image_to_process)
+
+    final_image = Image.new('RGBA', (512, 64))
+
+    x_offset = 0
+    y_offset = 0
+    for name, processed_img in processed_images.items():
+        final_image.paste(processed_img, (x_offset, y_offset))
+        x_offset += processed_img.size[0]
+        if x_offset >= final_image.size[0]:
+            x_offset = 0
+            y_offset += processed_img.size[1]
+
+    byte_io = BytesIO()
+    final_image.save(byte_io, 'PNG')
+    byte_io.seek(0)
+    return byte_io
+
+
 class SkinDB(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
         # im using a dict to store all message ids for now
         self.original_message_id_and_preview_message_id = {}
 
-    @commands.Cog.listener('on_message')
+    @route(channel=CHAN_SKIN_SUBMIT)
     async def check_message_format_and_render(self, message: discord.Message):
         if check_if_staff(message) or message.author.bot:
             return
@@ -255,35 +286,8 @@ class SkinDB(commands.Cog):
                 await asyncio.sleep(2 * 60)
                 await privacy_err_msg.delete()
         else:
-            attachments = message.attachments
-            images = []
-            for attachment in attachments:
-                img_bytes = await attachment.read()
-                img = Image.open(BytesIO(img_bytes))
-                images.append(img)
-
-            image_to_process = None
-            for img in images:
-                if img.size == (256, 128):
-                    image_to_process = img
-                    break
-
-            processed_images = crop_and_generate_image(image_to_process)
-
-            final_image = Image.new('RGBA', (512, 64))
-
-            x_offset = 0
-            y_offset = 0
-            for name, processed_img in processed_images.items():
-                final_image.paste(processed_img, (x_offset, y_offset))
-                x_offset += processed_img.size[0]
-                if x_offset >= final_image.size[0]:
-                    x_offset = 0
-                    y_offset += processed_img.size[1]
-
-            byte_io = BytesIO()
-            final_image.save(byte_io, 'PNG')
-            byte_io.seek(0)
+            attachments = [await attachment.read() for attachment in message.attachments]
+            byte_io = await self.bot.renderer.render(generate_preview, attachments)
             file = discord.File(byte_io, filename='final_image.png')
 
             image_preview_message = await message.channel.send(file=file)
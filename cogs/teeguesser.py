@@ -8,6 +8,8 @@ from discord.ext import commands
 from io import BytesIO
 from typing import Optional
 
+from utils.router import route
+
 GUILD_DDNET     = 252358080522747904
 CHAN_ANSWERS    = 1190971438988001340
 TH_QUIZ         = 1190971707058561054
@@ -335,10 +337,9 @@ class Teeguesser(commands.Cog):
 
         await channel.set_permissions(channel.guild.default_role, send_messages=True, view_channel=False)
 
-    @commands.Cog.listener('on_message')
+    @route(channel=CHAN_ANSWERS)
     async def observer(self, message: discord.Message):
-        if (message.guild is None or message.guild.id != GUILD_DDNET
-                or message.channel.id != CHAN_ANSWERS or message.author.bot or not self._answer):
+        if message.guild is None or message.guild.id != GUILD_DDNET or message.author.bot or not self._answer:
             return
 
         # asyncio.lock to prevent race condition issues
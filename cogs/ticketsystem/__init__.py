@@ -12,6 +12,8 @@ from typing import Union
 from cogs.ticketsystem.buttons import MainMenu
 from cogs.ticketsystem.close import CloseButton, process_ticket_closure
 from cogs.ticketsystem.subscribe import SubscribeMenu
+from utils.metrics import metrics
+from utils.router import route
 from utils.transcript import transcript
 
 GUILD_DDNET            = 252358080522747904
@@ -300,6 +302,7 @@ class TicketSystem(commands.Cog):
         )
 
     @tasks.loop(hours=1)
+    @metrics.timed('task')
     async def check_inactive_tickets(self):
         channels_to_remove = []
         for ticket_user_id, ticket_data in self.ticket_data.get("tickets", {}).items():
@@ -419,6 +422,7 @@ class TicketSystem(commands.Cog):
         await self.bot.wait_until_ready()
 
     @tasks.loop(hours=1)
+    @metrics.timed('task')
     async def update_scores_topic(self):
         score_file = "data/ticket-system/scores.json"
         with open(score_file, "r") as file:
@@ -449,7 +453,7 @@ class TicketSystem(commands.Cog):
         self.bot.add_view(view=CloseButton(self.bot, self.ticket_data))
         self.bot.add_view(view=SubscribeMenu(self.ticket_data))
 
-    @commands.Cog.listener('on_message')
+    @route()
     async def server_link_verify(self, message: discord.Message):
         if message.guild is None or message.author.bot or message.guild.id != GUILD_DDNET:
             return
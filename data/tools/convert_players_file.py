@@ -1,59 +1,396 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
+import argparse
 import asyncio
-import json
 import os
+import pickle
+import posixpath
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+import zipfile
 from collections import defaultdict
-from datetime import datetime
+from datetime import date, datetime
+from typing import AbstractSet, Any, AsyncIterator, Dict, Iterator, List, Optional, Set, Tuple
 
 import asyncpg
+import msgpack
 
 TIMESTAMP = datetime.utcnow().strftime('%Y-%m-%d %H:%M')
 
-async def main():
-    with open('players-file.json', 'r') as f:
-        data = json.loads(f.read())
+# the $points graph is 800px wide, more points than this per player can't be told apart
+SERIES_POINTS = 400
 
-    tables = defaultdict(list)
+# constraints and indexes of a live table, rebuilt on its shadow table after the load
+CONSTRAINTS_QUERY = """SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint
+                       WHERE conrelid = $1::text::regclass AND contype IN ('p', 'u', 'f', 'x');
+                    """
+INDEXES_QUERY = """SELECT indexname, indexdef FROM pg_indexes
+                   WHERE tablename = $1 AND indexname NOT IN (SELECT conname FROM pg_constraint WHERE conrelid = $1::text::regclass);
+                """
 
-    for player, details in data['players'].items():
-        if len(player) > 15:
-            print(player)
+# diskcache stores pickled values with this mode, either inline or in a separate file
+MODE_PICKLE = 4
+
+PROGRESS_EVERY = 50000
+
+# schema changes databases created before them need, applied before every import
+MIGRATION_QUERIES = (
+    # stats_finishes needs a primary key for the upsert
+    """DO $$ BEGIN
+           IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conrelid = 'stats_finishes'::regclass AND contype = 'p') THEN
+               ALTER TABLE stats_finishes ADD PRIMARY KEY (name, timestamp);
+           END IF;
+       END $$;
+    """,
+    'DROP INDEX IF EXISTS finishes_idx;',
+    # stats_points_series is loaded like the other tables, which copies the live one
+    'CREATE TABLE IF NOT EXISTS stats_points_series (name VARCHAR(15) NOT NULL, timestamp DATE NOT NULL, points INT NOT NULL);',
+    'CREATE INDEX IF NOT EXISTS points_series_idx ON stats_points_series (name);',
+    # stats_generation only came with the image caches, the bump at the end needs it
+    'CREATE TABLE IF NOT EXISTS stats_generation (generation INT NOT NULL);',
+    'INSERT INTO stats_generation (generation) SELECT 0 WHERE NOT EXISTS (SELECT 1 FROM stats_generation);',
+)
+
+# finishes are re-aggregated from the last imported day on, which may have been incomplete, and over the
+# whole history of the players in $2, everything in that range that wasn't staged again is gone
+UPSERT_QUERY = """INSERT INTO stats_finishes SELECT * FROM stats_finishes_staged
+                  ON CONFLICT (name, timestamp) DO UPDATE SET points = EXCLUDED.points
+                  WHERE stats_finishes.points <> EXCLUDED.points;
+               """
+DELETE_QUERY = """DELETE FROM stats_finishes f WHERE (f.timestamp >= $1 OR f.name = ANY($2::text[])) AND NOT EXISTS (
+                      SELECT 1 FROM stats_finishes_staged s WHERE s.name = f.name AND s.timestamp = f.timestamp
+                  );
+               """
+
+# stats_finishes as it will be after the merge, the series are built before it is applied
+MERGED_QUERY = """SELECT name, timestamp, points FROM stats_finishes WHERE timestamp < $1 AND NOT name = ANY($2::text[])
+                  UNION ALL
+                  SELECT name, timestamp, points FROM stats_finishes_staged
+                  ORDER BY name, timestamp;
+               """
+REBUILT_QUERY = 'SELECT name, timestamp, points FROM stats_finishes_new ORDER BY name, timestamp;'
+
+DIFF_QUERY = """SELECT COALESCE(f.name, s.name), COALESCE(f.timestamp, s.timestamp), f.points, s.points
+                FROM stats_finishes f FULL OUTER JOIN stats_finishes_staged s
+                ON f.name = s.name AND f.timestamp = s.timestamp
+                WHERE f.points IS DISTINCT FROM s.points
+                ORDER BY 1, 2;
+             """
+
+def points_series(days: List[Tuple[date, int]]) -> List[Tuple[date, int]]:
+    """Cumulative points, keeping the first finish as is and after that only the total at the last
+       finish of each of at most `SERIES_POINTS` equally wide buckets of days. `days` have to be sorted.
+    """
+    first, last = days[0][0], days[-1][0]
+    bucket_days = max((last - first).days // SERIES_POINTS + 1, 1)
+
+    series = []
+    total = 0
+    for timestamp, points in days:
+        total += points
+        bucket = (timestamp - first).days // bucket_days if series else -1  # keep the first finish as is
+        if series and series[-1][0] == bucket:
+            series[-1] = (bucket, timestamp, total)
+        else:
+            series.append((bucket, timestamp, total))
+
+    return [(t, p) for _, t, p in series]
+
+def py2_str(value: str) -> str:
+    # the cache is written by python 2, its utf-8 byte strings come out of pickle as latin-1
+    return value.encode('latin-1').decode('utf-8')
+
+def ranked(unpacker: msgpack.Unpacker) -> Iterator[Tuple[str, int, int]]:
+    """Unpack a `((player, points), ...)` list one entry at a time, tied players share a rank"""
+    rank = 0
+    skips = 1
+    prev_points = 0
+    for _ in range(unpacker.read_array_header()):
+        player, points = unpacker.unpack()
+        if points != prev_points:
+            prev_points = points
+            rank += skips
+            skips = 1
+        else:
+            skips += 1
+
+        yield player, points, rank
+
+def read_players(path: str) -> Tuple[Dict[str, list], Dict[str, list]]:
+    """Return `{map: [server, points, finishers, ranks]}` and the stats_players columns by player"""
+    players = defaultdict(lambda: [None] * 6 + ['UNK'])
+
+    with open(path, 'rb') as f:
+        unpacker = msgpack.Unpacker(f, use_list=False, raw=False)
+        unpacker.skip()                                 # Server types: `(type, ...)`
+        maps = {                                        # Maps: `{type: ((map, points, finishers), ...), ...}`
+            map_: [server, points, finishers, []]
+            for server, maps in unpacker.unpack().items()
+            for map_, points, finishers in maps
+        }
+        unpacker.skip()                                 # Total points: `points`
+        for player, points, rank in ranked(unpacker):   # Points: `((player, points), ...)`
+            players[player][0:2] = points, rank
+        unpacker.skip()                                 # Weekly points: `((player, points), ...)`
+        unpacker.skip()                                 # Monthly points: `((player, points), ...)`
+        unpacker.skip()                                 # Yearly points: `((player, points), ...)`
+        for player, points, rank in ranked(unpacker):   # Team rank points: `((player, points), ...)`
+            players[player][2:4] = points, rank
+        for player, points, rank in ranked(unpacker):   # Solo rank points: `((player, points), ...)`
+            players[player][4:6] = points, rank
+
+    if not maps:
+        print("Empty or invalid msgpack")
+        sys.exit(2)
+
+    return maps, players
+
+def read_cache(path: str) -> Iterator[Tuple[str, Any]]:
+    """Yield the `(player, value)` entries of a zipped diskcache one at a time.
+
+       Only the sqlite index is copied out of the zip, values stored in separate files are read
+       from the zip directly.
+    """
+    with zipfile.ZipFile(path, 'r') as zf, tempfile.NamedTemporaryFile(suffix='.db') as db:
+        index = next(n for n in zf.namelist() if posixpath.basename(n) == 'cache.db')
+        root = posixpath.dirname(index)
+        with zf.open(index) as f:
+            shutil.copyfileobj(f, db)
+        db.flush()
+
+        con = sqlite3.connect(db.name)
+        try:
+            total, = con.execute('SELECT COUNT(*) FROM Cache;').fetchone()
+            start = time.monotonic()
+
+            query = 'SELECT key, raw, mode, filename, value FROM Cache;'
+            for i, (key, raw, mode, filename, value) in enumerate(con.execute(query), start=1):
+                if i % PROGRESS_EVERY == 0:
+                    print(f'{i}/{total} players ({time.monotonic() - start:.0f}s)')
+
+                key = bytes(key).decode('utf-8') if raw else py2_str(pickle.loads(key, encoding='latin-1'))
+                if value is None and filename:
+                    value = zf.read(posixpath.join(root, filename))
+
+                if mode == MODE_PICKLE:
+                    value = pickle.loads(value, encoding='latin-1')
+
+                yield key, value
+        finally:
+            con.close()
+
+def finishes(cache: str, maps: Dict[str, list], players: Dict[str, list], since: Optional[date]=None, *,
+             known: AbstractSet[str]=frozenset(), changed: AbstractSet[str]=frozenset(),
+             rebuilt: Optional[Set[str]]=None) -> Iterator[Tuple[str, date, int]]:
+    """Yield stats_finishes rows from the cache, filling in map ranks and player countries along the way.
+
+       With `since` only rows from that day on are yielded, except for players not in `known` or with
+       a finish on one of the `changed` maps. Their whole history is yielded and they're added to `rebuilt`.
+    """
+    for player, (player_maps, countries) in read_cache(cache):
+        if player not in players or players[player][0] is None:
             continue
 
-        tables['stats_players'].append((
-            player,
-            *details.get('points', (None, None)),
-            *details.get('teamrank', (None, None)),
-            *details.get('rank', (None, None)),
-            details.get('country', 'UNK')[:3]
-        ))
+        start = since
+        if since is not None and (player not in known or any(py2_str(m) in changed for m in player_maps)):
+            start = None
+            if rebuilt is not None:
+                rebuilt.add(player)
 
-    tables['stats_finishes'] = [
-        (player, datetime.strptime(timestamp, '%Y-%m-%d'), points)
-        for player, dates in data['finishes'].items()
-        for timestamp, points in dates.items() if len(player) <= 15
-    ]
+        days = defaultdict(int)
+        for map_, (_, rank, _, timestamp, time_) in player_maps.items():
+            map_ = py2_str(map_)
+            if map_ not in maps:
+                continue
 
-    for map_, details in data['maps'].items():
-        ranks = sorted([tuple(r) for r in details.pop(3)], key=lambda r: (r[1], r[0]))[:10]
-        tables['stats_maps'].append((map_, *details, ranks))
+            if 1 <= rank <= 10:  # there are invalid rank 0s for some reason
+                maps[map_][3].append((player, rank, time_))
 
-    con = await asyncpg.connect()
+            points = maps[map_][1]
+            if points > 0 and not isinstance(timestamp, str):  # if timestamp is a string, the rank is corrupt
+                days[timestamp.date()] += points
+
+        # '', 'AUS', 'BRA', 'CAN', 'CHL', 'CHN', 'FRA', 'GER', 'GER2', 'IRN', 'KSA', 'RUS', 'USA', 'ZAF'
+        if countries:
+            eu_countries = ('', 'FRA', 'GER', 'GER2')  # '' = OLD (GER)
+            eu_finishes = sum(countries.pop(c, 0) for c in eu_countries)
+            if eu_finishes:
+                countries['EUR'] = eu_finishes
+
+            # sort alphabetically to get consistent results
+            players[player][6] = max(sorted(countries.items()), key=lambda c: c[1])[0][:3]
+
+        if len(player) <= 15:
+            for timestamp, points in days.items():
+                if start is None or timestamp >= start:
+                    yield player, timestamp, points
+
+async def series(con: asyncpg.Connection, query: str, *args) -> AsyncIterator[Tuple[str, date, int]]:
+    """Yield stats_points_series rows computed from the finishes `query` returns ordered by player and day"""
     async with con.transaction():
+        player, days = None, []
+        async for name, timestamp, points in con.cursor(query, *args, prefetch=10000):
+            if name != player:
+                if days:
+                    for row in points_series(days):
+                        yield (player, *row)
+
+                player, days = name, []
+
+            days.append((timestamp, points))
+
+        if days:
+            for row in points_series(days):
+                yield (player, *row)
+
+async def load_shadow(con: asyncpg.Connection, table: str, records: List[Tuple]) -> Tuple[str, List[str], List[str]]:
+    """Copy `records` into `<table>_new` and build the indexes and constraints of `table` on it,
+       the live table is only read from
+    """
+    shadow = f'{table}_new'
+    await con.execute(f'DROP TABLE IF EXISTS {shadow};')
+    await con.execute(f'CREATE TABLE {shadow} (LIKE {table} INCLUDING DEFAULTS INCLUDING CONSTRAINTS);')
+    msg = await con.copy_records_to_table(shadow, records=records)
+
+    constraints = await con.fetch(CONSTRAINTS_QUERY, table)
+    for name, definition in constraints:
+        await con.execute(f'ALTER TABLE {shadow} ADD CONSTRAINT {name}_new {definition};')
+
+    indexes = await con.fetch(INDEXES_QUERY, table)
+    for name, definition in indexes:
+        unique = 'UNIQUE ' if definition.startswith('CREATE UNIQUE') else ''
+        method = definition.split(' USING ', 1)[1]
+        await con.execute(f'CREATE {unique}INDEX {name}_new ON {shadow} USING {method};')
+
+    await con.execute(f'ANALYZE {shadow};')
+    return msg, [n for n, _ in constraints], [n for n, _ in indexes]
+
+async def swap(con: asyncpg.Connection, table: str, constraints: List[str], indexes: List[str]):
+    await con.execute(f'DROP TABLE {table};')
+    await con.execute(f'ALTER TABLE {table}_new RENAME TO {table};')
+
+    for name in constraints:
+        await con.execute(f'ALTER TABLE {table} RENAME CONSTRAINT {name}_new TO {name};')
+
+    for name in indexes:
+        await con.execute(f'ALTER INDEX {name}_new RENAME TO {name};')
+
+async def stage_finishes(con: asyncpg.Connection, records: Iterator[Tuple[str, date, int]], *, temp: bool=True) -> str:
+    """Copy `records` into stats_finishes_staged, the import needs a regular table the series connection can read"""
+    if temp:
+        await con.execute('CREATE TEMP TABLE stats_finishes_staged (LIKE stats_finishes);')
+    else:
+        await con.execute('DROP TABLE IF EXISTS stats_finishes_staged;')
+        await con.execute('CREATE UNLOGGED TABLE stats_finishes_staged (LIKE stats_finishes);')
+
+    return await con.copy_records_to_table('stats_finishes_staged', records=records)
+
+async def verify(ppack: str, cache: str):
+    """Aggregate all finishes from scratch and print how they differ from stats_finishes"""
+    maps, players = read_players(ppack)
+
+    con = await asyncpg.connect()
+    try:
+        await stage_finishes(con, finishes(cache, maps, players))
+        diff = await con.fetch(DIFF_QUERY)
+    finally:
+        await con.close()
+
+    for name, timestamp, stored, expected in diff[:50]:
+        print(f'{name} {timestamp}: stored {stored}, expected {expected}')
+
+    print(f'[{TIMESTAMP}] stats_finishes: {len(diff)} rows differ from a full rebuild')
+    if diff:
+        print('Run the import with --full to rebuild it')
+
+    sys.exit(1 if diff else 0)
+
+async def main(ppack: str, cache: str, full: bool):
+    maps, players = read_players(ppack)
+
+    # load everything next to the live tables first, they are only locked for the merge and swap at the end
+    con = await asyncpg.connect()
+    series_con = await asyncpg.connect()
+    for query in MIGRATION_QUERIES:
+        await con.execute(query)
+
+    since = None if full else await con.fetchval('SELECT MAX(timestamp) FROM stats_finishes;')
+    tables = ['stats_points_series', 'stats_players', 'stats_maps']
+    if since is None:
+        tables.insert(0, 'stats_finishes')
+
+    try:
         status = []
-        for table, records in tables.items():
-            await con.execute(f'TRUNCATE {table} RESTART IDENTITY;')
+        rebuilt = set()
+        if since is not None:
+            # players that are new, were renamed or finished a map whose points changed get their whole history
+            # staged, players that are gone entirely get all of their rows deleted
+            known = {r['name'] for r in await con.fetch('SELECT name FROM stats_players;')}
+            old_points = {r['name']: r['points'] for r in await con.fetch('SELECT name, points FROM stats_maps;')}
+            changed = {m for m, d in maps.items() if old_points.pop(m, None) != d[1]} | old_points.keys()
+
+            print('stats_finishes')
+            records = finishes(cache, maps, players, since, known=known, changed=changed, rebuilt=rebuilt)
+            staged = await stage_finishes(con, records, temp=False)
+            rebuilt |= known - {p for p, v in players.items() if v[0] is not None}
+
+        names = {}
+        for table in tables:
             print(table)
-            msg = await con.copy_records_to_table(table, records=records)
+            if table == 'stats_finishes':
+                records = finishes(cache, maps, players)
+            elif table == 'stats_points_series':
+                if since is None:
+                    records = series(series_con, REBUILT_QUERY)
+                else:
+                    records = series(series_con, MERGED_QUERY, since, list(rebuilt))
+            elif table == 'stats_players':
+                records = ((p, *v) for p, v in players.items() if len(p) <= 15)
+            else:
+                records = ((m, *d[:3], sorted(d[3], key=lambda r: (r[1], r[0]))[:10]) for m, d in maps.items())
+
+            msg, constraints, indexes = await load_shadow(con, table, records)
+            names[table] = (constraints, indexes)
             status.append(f'{table}: {msg}')
 
-    await con.close()
+        async with con.transaction():
+            if since is not None:
+                deleted = await con.execute(DELETE_QUERY, since, list(rebuilt))
+                upserted = await con.execute(UPSERT_QUERY)
+                status.insert(0, f'stats_finishes: {staged} since {since} ({len(rebuilt)} players in full), {upserted}, {deleted}')
 
-    os.remove('players-file.json')
-    print(f'[{TIMESTAMP}] Successfully updated:', ', '.join(status))
+            for table, (constraints, indexes) in names.items():
+                await swap(con, table, constraints, indexes)
 
+            await con.execute('UPDATE stats_generation SET generation = generation + 1;')
+    finally:
+        for table in tables:
+            await con.execute(f'DROP TABLE IF EXISTS {table}_new;')
+
+        await con.execute('DROP TABLE IF EXISTS stats_finishes_staged;')
+        await series_con.close()
+        await con.close()
+
+    print(f'[{TIMESTAMP}] Successfully updated:', ', '.join(status))
 
 if __name__ == '__main__':
-    asyncio.run(main())
+    parser = argparse.ArgumentParser()
+    parser.add_argument('ppack', metavar='players-msgpack')
+    parser.add_argument('cache', metavar='players-cache-zip')
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument('--full', action='store_true', help='rebuild stats_finishes from scratch')
+    mode.add_argument('--verify', action='store_true', help='compare stats_finishes against a full rebuild and exit')
+    args = parser.parse_args()
+
+    if not os.path.isfile(args.ppack) or not zipfile.is_zipfile(args.cache):
+        print("Invalid arguments")
+        sys.exit(1)
+
+    if args.verify:
+        asyncio.run(verify(args.ppack, args.cache))
+    else:
+        asyncio.run(main(args.ppack, args.cache, args.full))
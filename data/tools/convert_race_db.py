@@ -0,0 +1,306 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import argparse
+import asyncio
+import io
+import re
+import sys
+import time
+import zipfile
+from collections import Counter
+from datetime import datetime
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+import asyncpg
+
+TIMESTAMP = datetime.utcnow().strftime('%Y-%m-%d %H:%M')
+
+BATCH_SIZE = 100000
+
+# a quoted string, NULL, a number or the end of a row, `(` and `,` in between are skipped
+TOKEN = re.compile(r"'((?:[^'\\]|\\.)*)'|(NULL)|([-+0-9.eE]+)|(\))")
+ESCAPE = re.compile(r'\\(.)')
+ESCAPES = {'0': '', 'b': '\b', 'n': '\n', 'r': '\r', 't': '\t', 'Z': '\x1a'}
+
+# schema changes databases created before them need, applied before every import
+MIGRATION_QUERIES = (
+    # stats_hours needs a primary key for the upsert, finishes without a timestamp used to be counted
+    # under a NULL hour
+    """DO $$ BEGIN
+           IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conrelid = 'stats_hours'::regclass AND contype = 'p') THEN
+               DELETE FROM stats_hours WHERE hour IS NULL;
+               ALTER TABLE stats_hours ADD PRIMARY KEY (name, hour);
+           END IF;
+       END $$;
+    """,
+    'DROP INDEX IF EXISTS hours_idx;',
+    # finishes and latest finish per map, which the incremental import uses to find the maps that changed
+    """CREATE TABLE IF NOT EXISTS stats_race_maps (
+           map VARCHAR(128) PRIMARY KEY,
+           finishes INT NOT NULL,
+           latest TIMESTAMP
+       );
+    """,
+    """INSERT INTO stats_race_maps (map, finishes, latest)
+       SELECT map, COUNT(*), MAX(timestamp) FROM record_race
+       WHERE map IS NOT NULL AND NOT EXISTS (SELECT 1 FROM stats_race_maps) GROUP BY map;
+    """,
+    # stats_generation only came with the image caches, the bump at the end needs it
+    'CREATE TABLE IF NOT EXISTS stats_generation (generation INT NOT NULL);',
+    'INSERT INTO stats_generation (generation) SELECT 0 WHERE NOT EXISTS (SELECT 1 FROM stats_generation);',
+)
+
+# the whole dump is staged, but only the maps in record_race_changed, whose number of finishes or latest finish
+# differs from stats_race_maps, are diffed against record_race. Rows that are new or changed are added to and
+# rows that are gone (e.g. removed cheated runs) are subtracted from the derived tables
+INCREMENTAL_QUERIES = (
+    """CREATE TEMP TABLE record_race_dump_changed ON COMMIT DROP AS
+       SELECT * FROM record_race_dump WHERE map IN (SELECT map FROM record_race_changed);
+    """,
+    """CREATE TEMP TABLE record_race_current ON COMMIT DROP AS
+       SELECT * FROM record_race WHERE map IN (SELECT map FROM record_race_changed);
+    """,
+    """CREATE TEMP TABLE record_race_added ON COMMIT DROP AS
+       SELECT * FROM record_race_dump_changed EXCEPT ALL SELECT * FROM record_race_current;
+    """,
+    """CREATE TEMP TABLE record_race_removed ON COMMIT DROP AS
+       SELECT * FROM record_race_current EXCEPT ALL SELECT * FROM record_race_dump_changed;
+    """,
+    """INSERT INTO stats_hours (name, hour, finishes)
+       SELECT name, EXTRACT(HOUR FROM timestamp) AS hour, SUM(delta) FROM (
+           SELECT name, timestamp, 1 AS delta FROM record_race_added
+           UNION ALL
+           SELECT name, timestamp, -1 AS delta FROM record_race_removed
+       ) d WHERE timestamp IS NOT NULL GROUP BY name, hour HAVING SUM(delta) <> 0
+       ON CONFLICT (name, hour) DO UPDATE SET finishes = stats_hours.finishes + EXCLUDED.finishes;
+    """,
+    'DELETE FROM stats_hours WHERE finishes <= 0 AND name IN (SELECT name FROM record_race_removed);',
+    """INSERT INTO stats_times (name, time)
+       SELECT name, SUM(time) FROM (
+           SELECT name, time FROM record_race_added
+           UNION ALL
+           SELECT name, -time FROM record_race_removed
+       ) d GROUP BY name
+       ON CONFLICT (name) DO UPDATE SET time = stats_times.time + EXCLUDED.time;
+    """,
+    # record_race has no key, so every run of a (map, player) pair that lost a row is replaced with the dump's
+    """CREATE TEMP TABLE record_race_touched ON COMMIT DROP AS
+       SELECT DISTINCT map, name FROM record_race_removed;
+    """,
+    'DELETE FROM record_race r USING record_race_touched t WHERE r.map = t.map AND r.name = t.name;',
+    """INSERT INTO record_race
+       SELECT d.* FROM record_race_dump_changed d JOIN record_race_touched t ON d.map = t.map AND d.name = t.name;
+    """,
+    """INSERT INTO record_race
+       SELECT * FROM record_race_added a WHERE NOT EXISTS (
+           SELECT 1 FROM record_race_touched t WHERE t.map = a.map AND t.name = a.name
+       );
+    """,
+    """DELETE FROM stats_times s WHERE s.name IN (SELECT name FROM record_race_removed)
+       AND NOT EXISTS (SELECT 1 FROM record_race r WHERE r.name = s.name);
+    """,
+    """DELETE FROM stats_birthdays s WHERE s.name IN (SELECT name FROM record_race_removed)
+       AND NOT EXISTS (SELECT 1 FROM record_race r WHERE r.name = s.name);
+    """,
+    """INSERT INTO stats_birthdays (name, day, month)
+       SELECT DISTINCT ON (name) name, EXTRACT(DAY FROM timestamp), EXTRACT(MONTH FROM timestamp)
+       FROM record_race WHERE name IN (SELECT name FROM record_race_added UNION SELECT name FROM record_race_removed)
+       ORDER BY name, timestamp ASC
+       ON CONFLICT (name) DO UPDATE SET day = EXCLUDED.day, month = EXCLUDED.month;
+    """,
+    'DELETE FROM stats_race_maps WHERE map IN (SELECT map FROM record_race_changed);',
+    """INSERT INTO stats_race_maps (map, finishes, latest)
+       SELECT map, COUNT(*), MAX(timestamp) FROM record_race WHERE map IN (SELECT map FROM record_race_changed) GROUP BY map;
+    """,
+)
+
+REBUILD_QUERIES = (
+    'TRUNCATE stats_hours, stats_times, stats_birthdays, stats_race_maps RESTART IDENTITY;',
+    """INSERT INTO stats_race_maps (map, finishes, latest)
+       SELECT map, COUNT(*), MAX(timestamp) FROM record_race WHERE map IS NOT NULL GROUP BY map;
+    """,
+    """INSERT INTO stats_hours (name, hour, finishes)
+       SELECT name, EXTRACT(HOUR FROM timestamp) AS hour, COUNT(*) FROM record_race
+       WHERE timestamp IS NOT NULL GROUP BY name, hour;
+    """,
+    """INSERT INTO stats_times (name, time)
+       SELECT name, SUM(time) FROM record_race GROUP BY name;
+    """,
+    """INSERT INTO stats_birthdays (name, day, month)
+       SELECT DISTINCT ON (name) name, EXTRACT(DAY FROM timestamp), EXTRACT(MONTH FROM timestamp)
+       FROM record_race ORDER BY name, timestamp ASC;
+    """,
+)
+
+# rows of the derived tables that differ from what a rebuild would produce
+VERIFY_QUERIES = {
+    'stats_race_maps': """SELECT COUNT(*) FROM stats_race_maps s FULL OUTER JOIN (
+                              SELECT map, COUNT(*) AS finishes, MAX(timestamp) AS latest
+                              FROM record_race WHERE map IS NOT NULL GROUP BY map
+                          ) r USING (map)
+                          WHERE (s.finishes, s.latest) IS DISTINCT FROM (r.finishes, r.latest);
+                       """,
+    'stats_hours': """SELECT COUNT(*) FROM stats_hours s FULL OUTER JOIN (
+                          SELECT name, EXTRACT(HOUR FROM timestamp) AS hour, COUNT(*) AS finishes
+                          FROM record_race WHERE timestamp IS NOT NULL GROUP BY name, hour
+                      ) r USING (name, hour)
+                      WHERE s.finishes IS DISTINCT FROM r.finishes;
+                   """,
+    'stats_times': """SELECT COUNT(*) FROM stats_times s FULL OUTER JOIN (
+                          SELECT name, SUM(time) AS time FROM record_race GROUP BY name
+                      ) r USING (name)
+                      WHERE s.time IS NULL OR r.time IS NULL OR ABS(s.time - r.time) > 0.01;
+                   """,
+    'stats_birthdays': """SELECT COUNT(*) FROM stats_birthdays s FULL OUTER JOIN (
+                              SELECT DISTINCT ON (name) name, EXTRACT(DAY FROM timestamp) AS day,
+                                                        EXTRACT(MONTH FROM timestamp) AS month
+                              FROM record_race ORDER BY name, timestamp ASC
+                          ) r USING (name)
+                          WHERE (s.day, s.month) IS DISTINCT FROM (r.day, r.month);
+                       """,
+}
+
+def timestamp(value: str) -> Optional[datetime]:
+    return None if value.startswith('0000-00-00') else datetime.fromisoformat(value)
+
+# map, name, timestamp, time, server, cp1 - cp25, gameid, ddnet7
+CONVERTERS: List[Callable] = [str, str, timestamp, float, str] + [float] * 25 + [str, int]
+
+def unescape(value: str) -> str:
+    return ESCAPE.sub(lambda m: ESCAPES.get(m.group(1), m.group(1)), value)
+
+def parse_rows(line: str) -> Iterator[Tuple]:
+    """Yield the rows of one extended `INSERT INTO ... VALUES (...),(...);` statement"""
+    values = []
+    for string, null, number, end in TOKEN.findall(line, line.index(' VALUES ') + 8):
+        if end:
+            yield tuple(None if v is None else c(v) for c, v in zip(CONVERTERS, values))
+            values = []
+        elif null:
+            values.append(None)
+        elif number:
+            values.append(number)
+        else:
+            values.append(unescape(string) if '\\' in string else string)
+
+def read_dump(path: str) -> Iterator[Tuple]:
+    """Stream the rows of record_race.sql straight out of the zipped dump"""
+    with zipfile.ZipFile(path, 'r') as zf:
+        name = next(n for n in zf.namelist() if n.endswith('record_race.sql'))
+        with zf.open(name) as f:
+            for line in io.TextIOWrapper(f, encoding='utf-8', errors='replace'):
+                if line.startswith('INSERT INTO'):
+                    yield from parse_rows(line)
+
+def batches(rows: Iterator[Tuple]) -> Iterator[List[Tuple]]:
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= BATCH_SIZE:
+            yield batch
+            batch = []
+
+    if batch:
+        yield batch
+
+def summarize(rows: Iterator[Tuple], summary: Dict[str, Tuple[int, Optional[datetime]]]) -> Iterator[Tuple]:
+    """Pass `rows` through, counting the finishes and the latest finish per map into `summary`"""
+    for row in rows:
+        map_, _, timestamp, *_ = row
+        finishes, latest = summary.get(map_, (0, None))
+        if timestamp is not None and (latest is None or timestamp > latest):
+            latest = timestamp
+
+        summary[map_] = (finishes + 1, latest)
+        yield row
+
+async def copy_dump(con: asyncpg.Connection, table: str, rows: Iterator[Tuple]) -> int:
+    start = time.monotonic()
+    total = 0
+    for batch in batches(rows):
+        await con.copy_records_to_table(table, records=batch)
+        total += len(batch)
+        print(f'{total} rows ({time.monotonic() - start:.0f}s)')
+
+    return total
+
+async def main(path: str, full: bool):
+    con = await asyncpg.connect()
+    try:
+        for query in MIGRATION_QUERIES:
+            await con.execute(query)
+
+        full = full or not await con.fetchval('SELECT EXISTS (SELECT 1 FROM record_race);')
+        if not full:
+            # the dump is staged outside of the transaction, record_race is only locked while applying the diff
+            summary = {}
+            await con.execute('DROP TABLE IF EXISTS record_race_dump;')
+            await con.execute('CREATE UNLOGGED TABLE record_race_dump (LIKE record_race);')
+            total = await copy_dump(con, 'record_race_dump', summarize(read_dump(path), summary))
+
+            stored = {r['map']: (r['finishes'], r['latest']) for r in await con.fetch('SELECT * FROM stats_race_maps;')}
+            changed = [(m,) for m in summary.keys() | stored.keys() if m is not None and summary.get(m) != stored.get(m)]
+
+        async with con.transaction():
+            if full:
+                await con.execute('TRUNCATE record_race RESTART IDENTITY;')
+                total = await copy_dump(con, 'record_race', read_dump(path))
+            else:
+                await con.execute('CREATE TEMP TABLE record_race_changed (map VARCHAR(128) PRIMARY KEY) ON COMMIT DROP;')
+                await con.copy_records_to_table('record_race_changed', records=changed)
+
+            for query in REBUILD_QUERIES if full else INCREMENTAL_QUERIES:
+                await con.execute(query)
+
+            if full:
+                mode = 'rebuilt'
+            else:
+                added = await con.fetchval('SELECT COUNT(*) FROM record_race_added;')
+                removed = await con.fetchval('SELECT COUNT(*) FROM record_race_removed;')
+                mode = f'{len(changed)} maps changed, {added} added, {removed} removed'
+
+            await con.execute('UPDATE stats_generation SET generation = generation + 1;')
+    finally:
+        await con.execute('DROP TABLE IF EXISTS record_race_dump;')
+        await con.close()
+
+    print(f'[{TIMESTAMP}] Successfully updated: record_race: COPY {total} ({mode}), stats_hours, stats_times, stats_birthdays')
+
+async def verify(path: Optional[str]):
+    con = await asyncpg.connect()
+    try:
+        diff = {t: await con.fetchval(q) for t, q in VERIFY_QUERIES.items()}
+        if path is not None:
+            # finishes per map, a mismatch means record_race itself drifted from the dump
+            counts = Counter(row[0] for row in read_dump(path))
+            for map_, finishes in await con.fetch('SELECT map, COUNT(*) FROM record_race GROUP BY map;'):
+                counts[map_] -= finishes
+
+            diff['record_race'] = sum(1 for c in counts.values() if c)
+    finally:
+        await con.close()
+
+    print(f'[{TIMESTAMP}] Rows differing from a rebuild:', ', '.join(f'{t}: {n}' for t, n in diff.items()))
+    if any(diff.values()):
+        print('Run the import with --full to rebuild')
+
+    sys.exit(1 if any(diff.values()) else 0)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('dump', metavar='ddnet-sql-zip', nargs='?')
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument('--full', action='store_true', help='reload record_race and rebuild the derived tables')
+    mode.add_argument('--verify', action='store_true',
+                      help='compare the derived tables against a rebuild, and record_race against the dump if given, and exit')
+    args = parser.parse_args()
+
+    if args.verify:
+        asyncio.run(verify(args.dump if args.dump is not None and zipfile.is_zipfile(args.dump) else None))
+
+    if args.dump is None or not zipfile.is_zipfile(args.dump):
+        print("Invalid arguments")
+        sys.exit(1)
+
+    asyncio.run(main(args.dump, args.full))
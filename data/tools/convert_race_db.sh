@@ -1,23 +1,9 @@
 #!/usr/bin/env zsh
 
-rm -rf ddnet-sql ddnet-sql.zip
+rm -f ddnet-sql.zip
 wget https://ddnet.org/stats/ddnet-sql.zip
-unzip ddnet-sql.zip
-rm ddnet-sql.zip
-
-echo 'TRUNCATE record_race RESTART IDENTITY;' > record_race.psql
-tail -n +72 ddnet-sql/record_race.sql >> record_race.psql
-
-rm -R ddnet-sql
 
-perl -i -p -E "s/\\\'(?:(?!,\'))/\'\'/g" record_race.psql
-sed -i '/^\/\*![0-9]\{5\}.*\*\//d' record_race.psql
-sed -i '/-- Dump completed/d; /UNLOCK TABLES;/d' record_race.psql
-sed -i 's/\\"/"/g' record_race.psql
-sed -i 's/\\\\/\\/g' record_race.psql
-sed -i "s/'0000-00-00 00:00:00'/NULL/g" record_race.psql
-sed -i "s/\`record_race\`/record_race/g" record_race.psql
-
-psql < record_race.psql
-
-psql -c 'BEGIN; TRUNCATE stats_hours, stats_times, stats_birthdays RESTART IDENTITY; INSERT INTO stats_hours (name, hour, finishes) SELECT name, EXTRACT(HOUR FROM timestamp) AS hour, COUNT(*) FROM record_race GROUP BY name, hour; INSERT INTO stats_times (name, time) SELECT name, SUM(time) FROM record_race GROUP BY name; INSERT INTO stats_birthdays (name, day, month) SELECT DISTINCT ON (name) name, EXTRACT(DAY FROM timestamp), EXTRACT(MONTH FROM timestamp) FROM record_race ORDER BY name, timestamp ASC; COMMIT;'
+# streams record_race.sql out of the zip with COPY, applies the rows that were added or removed since
+# the last import to record_race, stats_hours, stats_times and stats_birthdays, pass --full to rebuild
+python3 "${0:A:h}/convert_race_db.py" "$@" ddnet-sql.zip || exit 1
+rm ddnet-sql.zip
@@ -1,27 +1,35 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
+import argparse
 import asyncio
+import hashlib
+import json
 import os
-import sys
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 from datetime import datetime
 from io import BytesIO
-from typing import List, Tuple
+from typing import Dict, List, Optional, Tuple
 from urllib.parse import quote
 
 import asyncpg
 import msgpack
+import numpy as np
 import requests
-from colorthief import ColorThief
 from PIL import Image
 
 from utils.color import pack_rgb
+from utils.image import map_base
 from utils.text import normalize
 
 TIMESTAMP = datetime.utcnow().strftime('%Y-%m-%d %H:%M')
 
 BG_PATH = Path('data/assets/map_backgrounds/')
+BASE_PATH = Path('data/assets/map_bases/')
+
+# per release the hashes of its inputs, the outputs and the row last written to stats_maps_static
+MANIFEST_PATH = Path('data/assets/releases_manifest.jsonl')
 
 VALID_TILES = (
     'NPH_START',
@@ -39,6 +47,16 @@ VALID_TILES = (
 
 BG_SIZE = (800, 500)
 
+# stats_generation only came with the image caches, databases created before need it for the bump
+MIGRATION_QUERIES = (
+    'CREATE TABLE IF NOT EXISTS stats_generation (generation INT NOT NULL);',
+    'INSERT INTO stats_generation (generation) SELECT 0 WHERE NOT EXISTS (SELECT 1 FROM stats_generation);',
+)
+
+# the dominant color is taken from a downsampled thumbnail, quantized to 5 bits per channel
+COLOR_SIZE = (160, 100)
+COLOR_BITS = 5
+
 def get_tiles(packdir: Path, name: str) -> List[str]:
     pack = packdir / f"{name}.msgpack"
 
@@ -50,17 +68,88 @@ def get_tiles(packdir: Path, name: str) -> List[str]:
 
     return [t for t in tiles if t in VALID_TILES]
 
+def dominant_color(img: Image.Image) -> Tuple[int, int, int]:
+    """Average color of the most common quantized color, ignoring transparent and almost white pixels"""
+    img = img.copy()
+    img.thumbnail(COLOR_SIZE)
+    pixels = np.asarray(img.convert('RGBA')).reshape(-1, 4).astype(np.int64)
+
+    pixels = pixels[(pixels[:, 3] >= 125) & ~(pixels[:, :3] > 250).all(axis=1), :3]
+    if not len(pixels):
+        return 255, 255, 255
+
+    shift = 8 - COLOR_BITS
+    quantized = pixels >> shift
+    bins = (quantized[:, 0] << COLOR_BITS * 2) | (quantized[:, 1] << COLOR_BITS) | quantized[:, 2]
+    top = np.bincount(bins).argmax()
+
+    r, g, b = pixels[bins == top].mean(axis=0).round().astype(int).tolist()
+    return r, g, b
+
 def get_background(thumbdir: Path, name: str) -> int:
     thumb = thumbdir / f"{normalize(name)}.png"
-    with thumb.open("rb") as t:
-        img = Image.open(t).convert('RGBA').resize(BG_SIZE)
+    with Image.open(thumb) as img:
+        color = dominant_color(img)
+
+        img = img.convert('RGBA').resize(BG_SIZE)
         img.save(BG_PATH / f"{name}.png")
+        map_base(img).save(BASE_PATH / f"{name}.png")
 
-        color = ColorThief(t).get_color(quality=1)
     return pack_rgb(color)
 
-def get_data(relfile: Path, packdir: Path, thumbdir: Path) -> List[Tuple[str, datetime, str, List[str], str]]:
-    out = []
+def process_release(release: Tuple[str, datetime, Optional[str], Path, Path, Optional[dict]]) -> Optional[dict]:
+    """Redo only what the changed inputs affect, tiles and color of unchanged ones are taken from the manifest"""
+    name, timestamp, mappers, packdir, thumbdir, previous = release
+    try:
+        thumb = file_hash(thumbdir / f"{normalize(name)}.png")
+        pack = file_hash(packdir / f"{name}.msgpack")
+    except FileNotFoundError as exc:
+        # a single missing file shouldn't fail the whole import, whatever was imported before stays as is
+        print(f"Skipping {name}: {exc.filename} is missing")
+        return previous
+
+    outputs = [str(BG_PATH / f"{name}.png"), str(BASE_PATH / f"{name}.png")]
+    images = previous is None or previous['thumbnail'] != thumb or not all(os.path.isfile(o) for o in outputs)
+    tiles = previous is None or previous['msgpack'] != pack
+
+    return {
+        'name': name,
+        'timestamp': timestamp.strftime('%Y-%m-%d %H:%M'),
+        'mappers': mappers,
+        'thumbnail': thumb,
+        'msgpack': pack,
+        'tiles': get_tiles(packdir, name) if tiles else previous['tiles'],
+        'color': get_background(thumbdir, name) if images else previous['color'],
+        'outputs': outputs,
+    }
+
+def file_hash(path: Path) -> str:
+    h = hashlib.sha1()
+    with path.open('rb') as f:
+        for chunk in iter(lambda: f.read(1 << 16), b''):
+            h.update(chunk)
+
+    return h.hexdigest()
+
+def read_manifest() -> Dict[str, dict]:
+    if not MANIFEST_PATH.is_file():
+        return {}
+
+    with MANIFEST_PATH.open('r') as f:
+        return {e['name']: e for e in map(json.loads, f)}
+
+def write_manifest(manifest: Dict[str, dict]):
+    # written next to the old one and swapped in, a run that dies halfway leaves the old manifest intact
+    tmp = MANIFEST_PATH.with_suffix('.tmp')
+    with tmp.open('w') as f:
+        for entry in sorted(manifest.values(), key=lambda e: e['name']):
+            f.write(json.dumps(entry, sort_keys=True) + '\n')
+
+    os.replace(tmp, MANIFEST_PATH)
+
+def get_data(relfile: Path, packdir: Path, thumbdir: Path, manifest: Dict[str, dict],
+             workers: Optional[int]=None) -> List[dict]:
+    releases = []
 
     with relfile.open("r") as f:
         for line in f:
@@ -73,22 +162,21 @@ def get_data(relfile: Path, packdir: Path, thumbdir: Path) -> List[Tuple[str, da
                 _, name = details.split('|')
                 mappers = None
 
-            # This is an attempt at making updates incremental
-            if (BG_PATH / f"{name}.png").is_file():
-                continue
+            releases.append((name, datetime.strptime(timestamp, '%Y-%m-%d %H:%M'), mappers,
+                             packdir, thumbdir, manifest.get(name)))
 
-            out.append((
-                name,
-                datetime.strptime(timestamp, '%Y-%m-%d %H:%M'),
-                mappers,
-                get_tiles(packdir, name),
-                get_background(thumbdir, name)
-            ))
+    # hashing the inputs and decoding, resizing and encoding the images is CPU bound, so spread it over processes
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        entries = list(executor.map(process_release, releases, chunksize=8))
 
-    return out
+    # only rows whose inputs, credits or release date changed since the last run get upserted
+    return [e for e in entries if e is not None and e != manifest.get(e['name'])]
 
 async def update_database(data):
     con = await asyncpg.connect()
+    for query in MIGRATION_QUERIES:
+        await con.execute(query)
+
     async with con.transaction():
         query = """INSERT INTO stats_maps_static (name, timestamp, mappers, tiles, color)
                    VALUES ($1, $2, $3, $4, $5)
@@ -96,24 +184,37 @@ async def update_database(data):
                    SET timestamp = $2, mappers = $3, tiles = $4, color = $5;
                 """
         await con.executemany(query, data)
+        await con.execute('UPDATE stats_generation SET generation = generation + 1;')
 
     await con.close()
 
     return f'stats_maps_static: INSERT {len(data)}'
 
-def main(relfile, packdir, thumbdir):
-    data = get_data(relfile, packdir, thumbdir)
+def main(relfile, packdir, thumbdir, workers, full):
+    manifest = {} if full else read_manifest()
+    changed = get_data(relfile, packdir, thumbdir, manifest, workers)
+
+    data = [(e['name'], datetime.strptime(e['timestamp'], '%Y-%m-%d %H:%M'), e['mappers'], e['tiles'], e['color'])
+            for e in changed]
     status = asyncio.run(update_database(data)) if data else 'Nothing to update'
 
+    # the manifest is only updated once the rows are in, so a failed run gets retried completely
+    manifest.update((e['name'], e) for e in changed)
+    write_manifest(manifest)
+
     print(f'[{TIMESTAMP}] Successfully updated: {status}')
 
 
 if __name__ == '__main__':
-    if len(sys.argv) != 4:
-        print("Usage: {} <releases-file> <msgpack-dir> <thumbnail-dir>".format(sys.argv[0]))
-        sys.exit(1)
-
-    (relfile, packdir, thumbdir) = (Path(sys.argv[1]), Path(sys.argv[2]), Path(sys.argv[3]))
+    parser = argparse.ArgumentParser()
+    parser.add_argument('relfile', metavar='releases-file', type=Path)
+    parser.add_argument('packdir', metavar='msgpack-dir', type=Path)
+    parser.add_argument('thumbdir', metavar='thumbnail-dir', type=Path)
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='processes used for the images')
+    parser.add_argument('--full', action='store_true', help='ignore the manifest and reprocess every release')
+    args = parser.parse_args()
+
+    (relfile, packdir, thumbdir) = (args.relfile, args.packdir, args.thumbdir)
     if not relfile.is_file() or not packdir.is_dir() or not thumbdir.is_dir():
         print("Invalid arguments")
         exit(1)
@@ -121,4 +222,6 @@ if __name__ == '__main__':
     if not BG_PATH.is_dir():
         print(f"{BG_PATH} is not a directory")
 
-    main(relfile, packdir, thumbdir)
+    BASE_PATH.mkdir(exist_ok=True)
+
+    main(relfile, packdir, thumbdir, args.workers, args.full)
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, Tuple
+
+from PIL import Image, ImageFont
+
+from utils.render import register_stats
+
+DIR = 'data/assets'
+
+# font sizes used by the profile and meme renderers
+FONT_SIZES = {
+    'normal': (16, 20, 22, 24, 26, 30, 32, 36, 40, 46),
+    'bold': (34, 48),
+}
+
+
+def image_size(img: Image.Image) -> int:
+    return img.width * img.height * len(img.getbands())
+
+
+class AssetRegistry:
+    """Keeps fonts and decoded images from `data/assets` in memory.
+
+       Fonts are kept forever since there's only a handful of sizes. Images are kept in an LRU
+       bounded by `max_bytes` of decoded pixel data and reloaded when the file on disk changes,
+       which is checked at most once every `check_interval` seconds per image. Callers always
+       get a copy.
+    """
+
+    def __init__(self, root: str=DIR, *, max_bytes: int=96 * 1024 * 1024, check_interval: float=60.0):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.check_interval = check_interval
+
+        self._fonts: Dict[Tuple[str, int], ImageFont.FreeTypeFont] = {}
+        self._images: 'OrderedDict[str, Tuple[float, float, Image.Image]]' = OrderedDict()
+        self._bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def font(self, name: str, size: int) -> ImageFont.FreeTypeFont:
+        key = (name, size)
+        try:
+            font = self._fonts[key]
+        except KeyError:
+            self.misses += 1
+            font = self._fonts[key] = ImageFont.truetype(f'{self.root}/fonts/{name}.ttf', size)
+        else:
+            self.hits += 1
+
+        return font
+
+    def _load(self, path: str) -> Image.Image:
+        filename = f'{self.root}/{path}'
+        now = time.monotonic()
+
+        entry = self._images.get(path)
+        if entry is not None:
+            mtime, checked, img = entry
+            stale = False
+            if now - checked >= self.check_interval:
+                stale = os.stat(filename).st_mtime != mtime
+                checked = now
+
+            if not stale:
+                self.hits += 1
+                self._images[path] = (mtime, checked, img)
+                self._images.move_to_end(path)
+                return img
+
+            del self._images[path]
+            self._bytes -= image_size(img)
+
+        self.misses += 1
+        mtime = os.stat(filename).st_mtime
+        img = Image.open(filename)
+        img.load()
+
+        size = image_size(img)
+        if size > self.max_bytes:
+            return img
+
+        self._images[path] = (mtime, now, img)
+        self._bytes += size
+        while self._bytes > self.max_bytes:
+            _, (_, _, evicted) = self._images.popitem(last=False)
+            self._bytes -= image_size(evicted)
+            self.evictions += 1
+
+        return img
+
+    def image(self, path: str) -> Image.Image:
+        """Return a copy of the image at `path`, relative to the assets directory"""
+        return self._load(path).copy()
+
+    def preload(self, dirs: Iterable[str]=(), files: Iterable[str]=()):
+        for name, sizes in FONT_SIZES.items():
+            for size in sizes:
+                if (name, size) not in self._fonts:
+                    self.font(name, size)
+
+        paths = list(files)
+        for dir_ in dirs:
+            paths.extend(f'{dir_}/{f}' for f in sorted(os.listdir(f'{self.root}/{dir_}')) if f.endswith('.png'))
+
+        for path in paths:
+            if path not in self._images:
+                self._load(path)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'fonts': len(self._fonts),
+            'images': len(self._images),
+            'bytes': self._bytes,
+        }
+
+
+assets = AssetRegistry()
+register_stats('assets', assets.stats)
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+from typing import Dict, Iterable, Optional, Tuple
+
+from PIL import Image
+
+from utils.assets import DIR
+from utils.render import register_stats
+
+Box = Tuple[int, int, int, int]
+
+SHEET_WIDTH = 1024
+
+
+class SpriteAtlas:
+    """Every image of an assets directory packed into one sprite sheet per size.
+
+       Sheets are built once per size on first use and composited from directly with a source
+       box, so drawing a sprite neither opens a file nor resizes or copies anything.
+    """
+
+    def __init__(self, directory: str, *, root: str=DIR):
+        self.directory = directory
+        self.root = root
+
+        self._names = sorted(f[:-4] for f in os.listdir(f'{root}/{directory}') if f.endswith('.png'))
+        self._sheets: Dict[Optional[int], Tuple[Image.Image, Dict[str, Box]]] = {}
+
+        self.hits = 0
+        self.misses = 0
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._names
+
+    def _build(self, size: Optional[int]) -> Tuple[Image.Image, Dict[str, Box]]:
+        sprites = []
+        for name in self._names:
+            img = Image.open(f'{self.root}/{self.directory}/{name}.png').convert('RGBA')
+            if size is not None:
+                img = img.resize((size, size))
+
+            sprites.append((name, img))
+
+        # simple shelf packing, sprites of one directory are about the same size anyway
+        boxes = {}
+        x = y = row_height = 0
+        for name, img in sprites:
+            if x + img.width > SHEET_WIDTH:
+                x = 0
+                y += row_height
+                row_height = 0
+
+            boxes[name] = (x, y, x + img.width, y + img.height)
+            x += img.width
+            row_height = max(row_height, img.height)
+
+        width = max((b[2] for b in boxes.values()), default=1)
+        sheet = Image.new('RGBA', (width, max(y + row_height, 1)))
+        for name, img in sprites:
+            sheet.paste(img, boxes[name][:2])
+
+        return sheet, boxes
+
+    def sprite(self, name: str, size: Optional[int]=None) -> Tuple[Image.Image, Box]:
+        """Return the sheet and the box of `name`, scaled to `size` x `size` or at its original size"""
+        try:
+            sheet, boxes = self._sheets[size]
+        except KeyError:
+            self.misses += 1
+            sheet, boxes = self._sheets[size] = self._build(size)
+        else:
+            self.hits += 1
+
+        return sheet, boxes[name]
+
+    def size(self, name: str, size: Optional[int]=None) -> Tuple[int, int]:
+        _, (left, top, right, bottom) = self.sprite(name, size)
+        return right - left, bottom - top
+
+    def draw(self, base: Image.Image, name: str, dest: Tuple[int, int], size: Optional[int]=None):
+        sheet, box = self.sprite(name, size)
+        base.alpha_composite(sheet, dest=dest, source=box)
+
+    def preload(self, sizes: Iterable[Optional[int]]=(None,)):
+        for size in sizes:
+            if size not in self._sheets:
+                self._sheets[size] = self._build(size)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'sheets': len(self._sheets),
+            'bytes': sum(s.width * s.height * 4 for s, _ in self._sheets.values()),
+        }
+
+
+flags = SpriteAtlas('flags')
+tiles = SpriteAtlas('tiles')
+
+register_stats('flags', flags.stats)
+register_stats('tiles', tiles.stats)
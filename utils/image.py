@@ -1,19 +1,141 @@
+import time
+from collections import OrderedDict
 from io import BytesIO
-from typing import Callable, List, Tuple, Union
+from typing import Callable, Dict, Hashable, Tuple
 
-from PIL import Image, ImageDraw, ImageFont
+from PIL import Image, ImageDraw, ImageFilter
 
+from utils.render import register_stats
 
-def save(img: Image.Image) -> BytesIO:
+
+class PrimitiveCache:
+    """LRU of small pre-rendered images like panels and name pills.
+
+       Cached images are shared, callers must only ever composite them and never draw on them.
+    """
+
+    def __init__(self, max_entries: int=64):
+        self.max_entries = max_entries
+        self._images: 'OrderedDict[Hashable, Image.Image]' = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable, factory: Callable[[], Image.Image]) -> Image.Image:
+        try:
+            img = self._images[key]
+        except KeyError:
+            self.misses += 1
+            img = self._images[key] = factory()
+            if len(self._images) > self.max_entries:
+                self._images.popitem(last=False)
+        else:
+            self.hits += 1
+            self._images.move_to_end(key)
+
+        return img
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'entries': len(self._images),
+        }
+
+
+primitives = PrimitiveCache()
+register_stats('primitives', primitives.stats)
+
+# name -> (PIL format, save options)
+ENCODERS = {
+    'png':      ('PNG', {'compress_level': 6}),
+    'png-fast': ('PNG', {'compress_level': 1}),
+    'webp':     ('WEBP', {'lossless': True, 'method': 4}),
+    'jpeg':     ('JPEG', {'quality': 92, 'subsampling': 0}),
+    'jpeg-low': ('JPEG', {'quality': 75}),
+}
+
+# Discord rejects larger attachments, images above this are re-encoded with the fallbacks in order
+MAX_UPLOAD = 8 * 1024 * 1024
+FALLBACKS = ('jpeg', 'jpeg-low')
+
+# image type -> encoder, can be overridden with FORMAT_<type> in the RENDER config section
+FORMATS = {
+    'profile': 'jpeg',
+    'map':     'jpeg',
+    'points':  'png',
+    'hours':   'png',
+    'splits':  'png',
+}
+
+EXTENSIONS = {
+    b'\x89PNG': 'png',
+    b'\xff\xd8': 'jpg',
+    b'RIFF': 'webp',
+}
+
+_encode_stats: Dict[str, int] = {}
+register_stats('encoders', lambda: dict(_encode_stats))
+
+
+def check_formats(formats: Dict[str, str]):
+    for kind, encoder in formats.items():
+        if encoder not in ENCODERS:
+            raise ValueError(f'Unknown image format {encoder!r} for {kind} images')
+
+def set_formats(formats: Dict[str, str]):
+    check_formats(formats)
+    FORMATS.update(formats)
+
+def save(img: Image.Image, kind: str='default') -> BytesIO:
+    encoder = FORMATS.get(kind, 'png')
+    buf = _encode(img, encoder)
+
+    for fallback in FALLBACKS:
+        if buf.getbuffer().nbytes <= MAX_UPLOAD:
+            break
+
+        if fallback != encoder:
+            _encode_stats['oversized'] = _encode_stats.get('oversized', 0) + 1
+            buf = _encode(img, fallback)
+
+    return buf
+
+def _encode(img: Image.Image, encoder: str) -> BytesIO:
+    format_, options = ENCODERS[encoder]
+    if format_ == 'JPEG' and img.mode != 'RGB':
+        img = img.convert('RGB')
+
+    start = time.perf_counter()
     buf = BytesIO()
-    img.save(buf, format='png')
+    img.save(buf, format=format_, **options)
     buf.seek(0)
+
+    elapsed = time.perf_counter() - start
+    for key, value in (('images', 1), ('bytes', buf.getbuffer().nbytes), ('ms', elapsed * 1000)):
+        key = f'{encoder}_{key}'
+        _encode_stats[key] = _encode_stats.get(key, 0) + value
+
     return buf
 
+def filename(name: str, buf: BytesIO) -> str:
+    """`name` with the extension matching the encoded image"""
+    magic = buf.getvalue()[:4]
+    ext = next((e for m, e in EXTENSIONS.items() if magic.startswith(m)), 'png')
+    return f'{name}.{ext}'
+
 def center(size: int, area_size: int=0) -> int:
     return int((area_size - size) / 2)
 
+def rectangle(size: Tuple[int, int], *, color: Tuple[int, int, int, int]) -> Image.Image:
+    key = ('rectangle', tuple(size), tuple(color))
+    return primitives.get(key, lambda: Image.new('RGBA', size, color=color))
+
 def round_rectangle(size: Tuple[int, int], radius: int, *, color: Tuple[int, int, int, int]) -> Image.Image:
+    key = ('round_rectangle', tuple(size), radius, tuple(color))
+    return primitives.get(key, lambda: _round_rectangle(size, radius, color))
+
+def _round_rectangle(size: Tuple[int, int], radius: int, color: Tuple[int, int, int, int]) -> Image.Image:
     width, height = size
 
     radius = min(width, height, radius * 2)
@@ -33,44 +155,12 @@ def round_rectangle(size: Tuple[int, int], radius: int, *, color: Tuple[int, int
 
     return rect.resize(size, resample=Image.LANCZOS, reducing_gap=1.0)  # antialiasing
 
-def auto_font(font: Union[ImageFont.FreeTypeFont, Tuple[str, int]], text: str, max_width: int,
-              *, check: Callable=lambda w, _: w) -> ImageFont.FreeTypeFont:
-    if isinstance(font, tuple):
-        font = ImageFont.truetype(*font)
-
-    while check(font.getsize(text)[0], font.size) > max_width:
-        font = ImageFont.truetype(font.path, font.size - 1)
-
-    return font
-
-def wrap_new(canv: ImageDraw.Draw, box: Tuple[Tuple[int, int], Tuple[int, int]], text: str, *, font: ImageFont.FreeTypeFont):
-    _, h = font.getsize('yA')
+def map_base(background: Image.Image) -> Image.Image:
+    """Blurred map background with the dark `$map` panel on top, text and tiles are drawn over this"""
+    base = background.filter(ImageFilter.GaussianBlur(radius=3))
 
-    max_width = box[1][0] - box[0][0]
-    max_height = box[1][1]
-
-    def write(x: int, y: int, line: List[str]):
-        text_ = ' '.join(line)
-        font_ = auto_font(font, text_, max_width)
-        w, h = font_.getsize(text_)
-        xy = (x + center(w, max_width), y)
-        canv.text(xy, text_, fill='black', font=font_)
-
-    x, y = box[0]
-    line = []
-    for word in text.split():
-        w, _ = font.getsize(' '.join(line + [word]))
-
-        if w > max_width:
-            write(x, y, line)
-
-            y += h
-            if y > max_height:
-                return
-
-            line = [word]
-        else:
-            line.append(word)
+    outer = 32
+    size = (base.width - outer * 2, base.height - outer * 2)
+    base.alpha_composite(round_rectangle(size, 12, color=(0, 0, 0, 175)), dest=(outer, outer))
 
-    if line:
-        write(x, y, line)
+    return base
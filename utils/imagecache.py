@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import hashlib
+import logging
+import os
+from collections import OrderedDict
+from io import BytesIO
+from typing import Dict, List, Optional, Tuple
+
+from utils.misc import executor
+
+log = logging.getLogger(__name__)
+
+
+@executor
+def read_file(path: str) -> bytes:
+    with open(path, 'rb') as f:
+        return f.read()
+
+@executor
+def write_file(path: str, data: bytes):
+    with open(path, 'wb') as f:
+        f.write(data)
+
+@executor
+def remove_files(paths: List[str]):
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+class ImageCache:
+    """Encoded images on disk, keyed by a tuple of command arguments and the stats generation.
+
+       Files are named `<generation>-<sha1 of key>`, so bumping the generation makes every entry
+       unreachable and `set_generation` deletes them. Entries are evicted least recently used
+       first once they take up more than `max_bytes`. The index lives on the event loop, only
+       file access runs in the executor.
+    """
+
+    def __init__(self, directory: str, *, max_bytes: int=256 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.generation: Optional[int] = None
+
+        self._entries: 'OrderedDict[str, int]' = OrderedDict()
+        self._bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+
+        os.makedirs(directory, exist_ok=True)
+        files = [os.path.join(directory, f) for f in os.listdir(directory)]
+        for path in sorted(files, key=os.path.getmtime):
+            self._entries[os.path.basename(path)] = os.path.getsize(path)
+            self._bytes += os.path.getsize(path)
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def _name(self, key: Tuple) -> str:
+        digest = hashlib.sha1(repr(key).encode('utf-8')).hexdigest()
+        return f'{self.generation}-{digest}'
+
+    def _pop(self, name: str):
+        self._bytes -= self._entries.pop(name)
+
+    async def set_generation(self, generation: int):
+        if generation == self.generation:
+            return
+
+        log.info('Stats generation changed from %s to %d, dropping cached images', self.generation, generation)
+        self.generation = generation
+
+        prefix = f'{generation}-'
+        stale = [n for n in self._entries if not n.startswith(prefix)]
+        for name in stale:
+            self._pop(name)
+
+        await remove_files([self._path(n) for n in stale])
+
+    async def get(self, key: Tuple) -> Optional[BytesIO]:
+        if self.generation is None:
+            return None
+
+        name = self._name(key)
+        if name not in self._entries:
+            self.misses += 1
+            return None
+
+        try:
+            data = await read_file(self._path(name))
+        except FileNotFoundError:
+            if name in self._entries:
+                self._pop(name)
+
+            self.misses += 1
+            return None
+
+        if name in self._entries:
+            self._entries.move_to_end(name)
+
+        self.hits += 1
+        return BytesIO(data)
+
+    async def put(self, key: Tuple, buf: BytesIO, generation: Optional[int]):
+        """`generation` has to be read before querying the data `buf` is rendered from"""
+        # an image rendered from rows of the previous generation must not end up under the new one
+        if generation is None or generation != self.generation:
+            return
+
+        name = self._name(key)
+        data = buf.getvalue()
+        await write_file(self._path(name), data)
+
+        # set_generation may have already swept the directory while the file was being written
+        if generation != self.generation:
+            await remove_files([self._path(name)])
+            return
+
+        if name in self._entries:
+            self._pop(name)
+
+        self._entries[name] = len(data)
+        self._bytes += len(data)
+
+        evicted = []
+        while self._bytes > self.max_bytes:
+            evicted.append(next(iter(self._entries)))
+            self._pop(evicted[-1])
+
+        if evicted:
+            await remove_files([self._path(n) for n in evicted])
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'entries': len(self._entries),
+            'bytes': self._bytes,
+        }
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from typing import Callable, Dict, List, Tuple
+
+from PIL import ImageDraw, ImageFont
+
+from utils.image import center
+from utils.render import register_stats
+
+_fonts: Dict[Tuple[str, int], ImageFont.FreeTypeFont] = {}
+_widths: Dict[Tuple[str, int], Dict[str, float]] = {}
+_stats = {'hits': 0, 'misses': 0}
+
+
+def sized(font: ImageFont.FreeTypeFont, size: int) -> ImageFont.FreeTypeFont:
+    """Return `font` at `size`, every size is only loaded once"""
+    if font.size == size:
+        return font
+
+    key = (font.path, size)
+    try:
+        return _fonts[key]
+    except KeyError:
+        _fonts[key] = ImageFont.truetype(font.path, size)
+        return _fonts[key]
+
+def text_width(font: ImageFont.FreeTypeFont, text: str) -> float:
+    """Sum of the cached advance widths of each character"""
+    widths = _widths.setdefault((font.path, font.size), {})
+
+    total = 0.0
+    for char in text:
+        try:
+            total += widths[char]
+        except KeyError:
+            _stats['misses'] += 1
+            total += widths.setdefault(char, font.getlength(char))
+        else:
+            _stats['hits'] += 1
+
+    return total
+
+def fit_font(font: ImageFont.FreeTypeFont, text: str, max_width: int,
+             *, check: Callable=lambda w, _: w) -> ImageFont.FreeTypeFont:
+    """Largest size up to `font.size` for which `check(width, size)` stays within `max_width`"""
+    def fits(size: int) -> bool:
+        return check(text_width(sized(font, size), text), size) <= max_width
+
+    if fits(font.size):
+        return font
+
+    lo, hi = 1, font.size - 1
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if fits(mid):
+            lo = mid
+        else:
+            hi = mid - 1
+
+    return sized(font, lo)
+
+def wrap(font: ImageFont.FreeTypeFont, text: str, max_width: int) -> List[str]:
+    space = text_width(font, ' ')
+
+    lines = []
+    line = []
+    line_width = 0.0
+    for word in text.split():
+        w = text_width(font, word)
+        if line and line_width + space + w > max_width:
+            lines.append(' '.join(line))
+            line = []
+
+        line_width = line_width + space + w if line else w
+        line.append(word)
+
+    if line:
+        lines.append(' '.join(line))
+
+    return lines
+
+def draw_wrapped(canv: ImageDraw.Draw, box: Tuple[Tuple[int, int], Tuple[int, int]], text: str,
+                 *, font: ImageFont.FreeTypeFont, fill: str='black'):
+    """Draw `text` wrapped and centered inside `box`, lines that are still too wide get a smaller font"""
+    _, h = font.getsize('yA')
+
+    (x, y), (right, bottom) = box
+    max_width = right - x
+    for line in wrap(font, text, max_width):
+        if y > bottom:
+            return
+
+        font_ = fit_font(font, line, max_width)
+        w = text_width(font_, line)
+        canv.text((x + center(w, max_width), y), line, fill=fill, font=font_)
+        y += h
+
+def stats() -> Dict[str, int]:
+    return {
+        'hits': _stats['hits'],
+        'misses': _stats['misses'],
+        'fonts': len(_fonts),
+        'glyphs': sum(len(w) for w in _widths.values()),
+    }
+
+
+register_stats('layout', stats)
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import functools
+import time
+from bisect import bisect_left
+from collections import deque
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Tuple
+
+# upper bounds in seconds, Prometheus style
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class Histogram:
+    """Cumulative bucket counts for export and a window of recent samples for percentiles"""
+
+    def __init__(self, window: int=1024):
+        self.buckets = [0] * (len(BUCKETS) + 1)  # last one is +Inf
+        self.samples = deque(maxlen=window)
+        self.count = 0
+        self.total = 0.0
+        self.errors = 0
+        self.max = 0.0
+
+    def observe(self, seconds: float, error: bool=False):
+        self.buckets[bisect_left(BUCKETS, seconds)] += 1
+        self.samples.append(seconds)
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        if error:
+            self.errors += 1
+
+    def percentile(self, p: float) -> float:
+        if not self.samples:
+            return 0.0
+
+        samples = sorted(self.samples)
+        return samples[min(int(len(samples) * p), len(samples) - 1)]
+
+
+class Metrics:
+    def __init__(self):
+        self.histograms: Dict[Tuple[str, str], Histogram] = {}
+
+    def observe(self, kind: str, name: str, seconds: float, error: bool=False):
+        try:
+            histogram = self.histograms[kind, name]
+        except KeyError:
+            histogram = self.histograms[kind, name] = Histogram()
+
+        histogram.observe(seconds, error)
+
+    @contextmanager
+    def timer(self, kind: str, name: str):
+        start = time.perf_counter()
+        error = False
+        try:
+            yield
+        except Exception:
+            error = True
+            raise
+        finally:
+            self.observe(kind, name, time.perf_counter() - start, error)
+
+    def timed(self, kind: str, name: Optional[str]=None) -> Callable:
+        def decorator(func: Callable) -> Callable:
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                with self.timer(kind, name or func.__qualname__):
+                    return await func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def summary(self, kind: Optional[str]=None) -> List[List[str]]:
+        rows = []
+        for (kind_, name), h in sorted(self.histograms.items()):
+            if kind is not None and kind_ != kind:
+                continue
+
+            rows.append([
+                kind_,
+                name,
+                str(h.count),
+                str(h.errors),
+                *(f'{h.percentile(p) * 1000:.1f}' for p in (0.5, 0.95, 0.99)),
+                f'{h.max * 1000:.1f}',
+            ])
+
+        return rows
+
+    def prometheus(self) -> str:
+        lines = [
+            '# HELP ddnet_bot_latency_seconds Latency of commands, listeners and tasks',
+            '# TYPE ddnet_bot_latency_seconds histogram',
+        ]
+
+        errors = [
+            '# HELP ddnet_bot_errors_total Failed invocations of commands, listeners and tasks',
+            '# TYPE ddnet_bot_errors_total counter',
+        ]
+
+        for (kind, name), h in sorted(self.histograms.items()):
+            labels = f'kind="{kind}",name="{name}"'
+            cumulative = 0
+            for bound, count in zip(BUCKETS + ('+Inf',), h.buckets):
+                cumulative += count
+                lines.append(f'ddnet_bot_latency_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+
+            lines.append(f'ddnet_bot_latency_seconds_sum{{{labels}}} {h.total}')
+            lines.append(f'ddnet_bot_latency_seconds_count{{{labels}}} {h.count}')
+            errors.append(f'ddnet_bot_errors_total{{{labels}}} {h.errors}')
+
+        return '\n'.join(lines + errors) + '\n'
+
+
+metrics = Metrics()
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from typing import Any, List, Sequence, Tuple
+
+import numpy as np
+
+
+def step_line(days: np.ndarray, values: np.ndarray, *, bottom: float, x_mult: float, y_mult: float,
+              end: float, step: float) -> np.ndarray:
+    """Build the polyline of a cumulative series as an `(n, 2)` array of pixel coordinates.
+
+       `days` are offsets from the left edge, gaps wider than `step` pixels are drawn as a flat
+       line followed by a vertical one and the last value is carried over to `end`.
+    """
+    x = days * x_mult
+    y = bottom - values * y_mult
+
+    prev_x = np.concatenate(([0.0], x[:-1]))
+    prev_y = np.concatenate(([bottom], y[:-1]))
+    steps = x - prev_x > step
+
+    # interleave (x, prev_y) before every (x, y) and drop the ones we don't need
+    xy = np.empty((len(x) * 2, 2))
+    xy[0::2, 0] = x
+    xy[0::2, 1] = prev_y
+    xy[1::2, 0] = x
+    xy[1::2, 1] = y
+    keep = np.ones(len(xy), dtype=bool)
+    keep[0::2] = steps
+
+    head = [(0.0, bottom)]
+    tail = [(end, y[-1])] if len(x) and x[-1] < end else []
+    return np.concatenate((np.array(head), xy[keep], np.array(tail).reshape(-1, 2)))
+
+
+def downsample(xy: np.ndarray, threshold: int) -> np.ndarray:
+    """Largest-Triangle-Three-Buckets downsampling to at most `threshold` points"""
+    n = len(xy)
+    if threshold >= n or threshold < 3:
+        return xy
+
+    # first and last points are always kept, the rest is split into equally sized buckets
+    edges = np.linspace(1, n - 1, threshold - 1).astype(int)
+    out = np.empty((threshold, 2))
+    out[0] = xy[0]
+    out[-1] = xy[-1]
+
+    a = xy[0]
+    for i in range(threshold - 2):
+        start, stop = edges[i], edges[i + 1]
+        bucket = xy[start:stop]
+
+        nxt = xy[stop:edges[i + 2]] if i + 2 < len(edges) else xy[-1:]
+        c = nxt.mean(axis=0)
+
+        area = np.abs((a[0] - c[0]) * (bucket[:, 1] - a[1]) - (a[0] - bucket[:, 0]) * (c[1] - a[1]))
+        a = out[i + 1] = bucket[area.argmax()]
+
+    return out
+
+
+def hour_counts(hours: Sequence[Tuple[int, int]]) -> np.ndarray:
+    """Spread `(hour, finishes)` rows over a 24 element array"""
+    counts = np.zeros(24)
+    if hours:
+        idx, finishes = np.array(hours, dtype=float).T
+        counts[idx.astype(int)] = finishes
+
+    return counts
+
+
+def merge_labels(labels: List[Tuple[float, Any]], height: float, merged: Any) -> List[Tuple[float, Any]]:
+    """Merge labels that are less than `height` apart into one, in a single pass over the sorted positions"""
+    out = []
+    for y, color in sorted(labels, key=lambda l: l[0]):
+        if out and y - out[-1][0] <= height:
+            out[-1] = ((out[-1][0] + y) / 2, merged)
+        else:
+            out.append((y, color))
+
+    return out
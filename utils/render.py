@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import asyncio
+import functools
+import importlib
+import logging
+import multiprocessing
+import os
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from io import BytesIO
+from typing import Callable, Dict, Optional, Set, Tuple
+
+log = logging.getLogger(__name__)
+
+# imported by every worker on startup so jobs don't pay for module imports and asset loading
+RENDER_MODULES = (
+    'cogs.profile',
+    'cogs.meme',
+    'cogs.skindb',
+)
+
+# workers start from a fresh interpreter instead of a fork of the bot, which by then has an event loop,
+# threads and database connections whose state a forked child would inherit half locked
+START_METHOD = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+
+
+# name -> function returning counters, collected in the worker after every job
+_stats_providers: Dict[str, Callable[[], Dict[str, int]]] = {}
+
+
+def register_stats(name: str, provider: Callable[[], Dict[str, int]]):
+    _stats_providers[name] = provider
+
+
+class RenderError(Exception):
+    pass
+
+
+class RendererBusy(RenderError):
+    def __init__(self):
+        super().__init__('The renderer is busy, try again in a moment')
+
+
+class RenderTimeout(RenderError):
+    def __init__(self):
+        super().__init__('Rendering took too long')
+
+
+def _init_worker(formats: Dict[str, str]):
+    importlib.import_module('utils.image').set_formats(formats)
+
+    for name in RENDER_MODULES:
+        module = importlib.import_module(name)
+        preload = getattr(module, 'preload', None)
+        if preload is not None:
+            preload()
+
+def _noop():
+    pass
+
+def _run(func: Callable[..., BytesIO], args: tuple, kwargs: dict) -> Tuple[BytesIO, int, Dict[str, Dict[str, int]]]:
+    result = func(*args, **kwargs)
+    return result, os.getpid(), {n: p() for n, p in _stats_providers.items()}
+
+
+class RenderService:
+    """Runs PIL image generation in a pool of warm worker processes.
+
+       At most `workers + queue_size` jobs are accepted at a time, any further job is rejected with
+       `RendererBusy` instead of piling up. Render functions have to be module level and their
+       arguments and return values have to be picklable.
+    """
+
+    def __init__(self, *, workers: int=2, queue_size: int=8, timeout: float=30.0, formats: Dict[str, str]=None):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self.formats = formats or {}
+
+        # a typo in the config should stop the bot right away, not break every worker the pool starts
+        importlib.import_module('utils.image').check_formats(self.formats)
+
+        self.rejected = 0
+        self.timeouts = 0
+        self.worker_stats: Dict[int, Dict[str, Dict[str, int]]] = {}
+
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._jobs: Set[Future] = set()
+
+    @property
+    def pending(self) -> int:
+        return len(self._jobs)
+
+    def start(self):
+        if self._executor is not None:
+            return
+
+        self._executor = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                             initargs=(self.formats,),
+                                             mp_context=multiprocessing.get_context(START_METHOD))
+        self._executor.submit(_noop)  # spawns the workers right away
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+        # counters are reported per pid, the ones of the old workers would otherwise be summed up forever
+        self.worker_stats.clear()
+
+    def _recycle(self, executor: ProcessPoolExecutor, func: Callable):
+        """Kill the workers of `executor`, jobs still running or queued on it fail with BrokenProcessPool"""
+        if self._executor is not executor:
+            return  # already replaced because of another job
+
+        log.warning('Render of %s hung, restarting the pool', func.__qualname__)
+
+        # a running job can't be cancelled, the only way to get its worker back is to kill it
+        processes = list((executor._processes or {}).values())
+        self.close()
+        for process in processes:
+            process.terminate()
+
+        self.start()
+
+    def _release(self, loop: asyncio.AbstractEventLoop, future: Future):
+        loop.call_soon_threadsafe(self._jobs.discard, future)
+
+    async def render(self, func: Callable[..., BytesIO], *args, **kwargs) -> BytesIO:
+        if self.pending >= self.workers + self.queue_size:
+            self.rejected += 1
+            raise RendererBusy()
+
+        self.start()
+
+        # the slot is released once the worker is done or, if it hangs, once the pool is recycled
+        loop = asyncio.get_running_loop()
+        executor = self._executor
+        future = executor.submit(_run, func, args, kwargs)
+        self._jobs.add(future)
+        future.add_done_callback(functools.partial(self._release, loop))
+
+        try:
+            result, pid, stats = await asyncio.wait_for(asyncio.wrap_future(future), timeout=self.timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            self._jobs.discard(future)
+
+            # only jobs that were still queued got cancelled, a running one keeps its worker busy until killed
+            if not future.cancelled():
+                self._recycle(executor, func)
+
+            raise RenderTimeout() from None
+        except BrokenProcessPool:
+            log.exception('Render worker died while running %s, restarting the pool', func.__qualname__)
+            if self._executor is executor:
+                self.close()
+
+            raise RenderError('The renderer crashed') from None
+
+        self.worker_stats[pid] = stats
+        return result
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """Sum up the counters last reported by each worker"""
+        out = {
+            'service': {
+                'workers': self.workers,
+                'pending': self.pending,
+                'rejected': self.rejected,
+                'timeouts': self.timeouts,
+            }
+        }
+
+        for stats in self.worker_stats.values():
+            for name, counters in stats.items():
+                totals = out.setdefault(name, {})
+                for key, value in counters.items():
+                    totals[key] = totals.get(key, 0) + value
+
+        return out
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import inspect
+from collections import defaultdict
+from typing import Callable, Dict, Iterable, List, Optional, Tuple, Union
+
+import discord
+from discord.ext import commands
+
+ANY = 'any'
+
+Key = Union[Tuple[str, int], str]
+Ids = Union[int, Iterable[int]]
+
+
+def _as_tuple(ids: Optional[Ids]) -> Tuple[int, ...]:
+    if ids is None:
+        return ()
+    if isinstance(ids, int):
+        return (ids,)
+    return tuple(ids)
+
+
+def route(*, channel: Ids=None, category: Ids=None, webhook: Ids=None) -> Callable:
+    """Mark a cog method as an on_message handler for the given channel, category and/or webhook ids.
+       Without any ids the handler receives every message.
+    """
+    keys = [('channel', i) for i in _as_tuple(channel)] \
+         + [('category', i) for i in _as_tuple(category)] \
+         + [('webhook', i) for i in _as_tuple(webhook)]
+
+    def decorator(func: Callable) -> Callable:
+        func.__route_keys__ = keys or [ANY]
+        return func
+
+    return decorator
+
+
+class MessageRouter:
+    def __init__(self):
+        self._handlers: Dict[Key, List[Callable]] = defaultdict(list)
+
+    def register(self, handler: Callable, keys: List[Key]):
+        for key in keys:
+            self._handlers[key].append(handler)
+
+    def add_cog(self, cog: commands.Cog):
+        for _, method in inspect.getmembers(cog, inspect.ismethod):
+            keys = getattr(method, '__route_keys__', None)
+            if keys is not None:
+                self.register(method, keys)
+
+    def remove_cog(self, cog: commands.Cog):
+        for key, handlers in list(self._handlers.items()):
+            handlers[:] = [h for h in handlers if getattr(h, '__self__', None) is not cog]
+            if not handlers:
+                del self._handlers[key]
+
+    def handlers_for(self, message: discord.Message) -> List[Callable]:
+        keys = [('channel', message.channel.id), ANY]
+
+        category_id = getattr(message.channel, 'category_id', None)
+        if category_id is not None:
+            keys.append(('category', category_id))
+
+        if message.webhook_id is not None:
+            keys.append(('webhook', message.webhook_id))
+
+        # a handler registered for both a channel and its category only runs once
+        handlers = {}
+        for key in keys:
+            for handler in self._handlers.get(key, ()):
+                handlers.setdefault(handler, None)
+
+        return list(handlers)
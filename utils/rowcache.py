@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import logging
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+log = logging.getLogger(__name__)
+
+
+class RowCache:
+    """Read-through LRU of query results for the stats tables, which only change on import.
+
+       Results are kept until they get evicted or the stats generation changes. Empty results
+       are cached as well so lookups of unknown names don't hit the database either.
+    """
+
+    def __init__(self, *, max_entries: int=4096):
+        self.max_entries = max_entries
+        self.generation: Optional[int] = None
+
+        self._rows: 'OrderedDict[Hashable, Any]' = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+
+    def set_generation(self, generation: int):
+        if generation == self.generation:
+            return
+
+        log.info('Stats generation changed from %s to %d, dropping %d cached rows',
+                 self.generation, generation, len(self._rows))
+        self.generation = generation
+        self._rows.clear()
+
+    async def get(self, key: Hashable, fetch: Callable[[], Awaitable[Any]]) -> Any:
+        try:
+            value = self._rows[key]
+        except KeyError:
+            pass
+        else:
+            self.hits += 1
+            self._rows.move_to_end(key)
+            return value
+
+        self.misses += 1
+        generation = self.generation
+        value = await fetch()
+
+        # don't store rows of the previous generation if it changed while we were waiting
+        if generation == self.generation:
+            self._rows[key] = value
+            if len(self._rows) > self.max_entries:
+                self._rows.popitem(last=False)
+
+        return value
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'entries': len(self._rows),
+        }
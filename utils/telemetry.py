@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import asyncio
+import logging
+from collections import deque
+from typing import Dict, Optional, Sequence, Tuple
+
+import asyncpg
+
+log = logging.getLogger(__name__)
+
+MIN_BACKOFF = 1.0
+
+# errors that go away once the database is reachable again, anything else is the rows' fault
+RETRYABLE = (
+    OSError,
+    asyncio.TimeoutError,
+    asyncpg.InterfaceError,
+    asyncpg.PostgresConnectionError,
+    asyncpg.CannotConnectNowError,
+    asyncpg.TooManyConnectionsError,
+)
+
+
+class TelemetrySink:
+    """Buffers rows in memory and writes them to a table with COPY once either
+       `batch_size` rows are queued or `flush_interval` seconds have passed.
+
+       At most `max_size` rows are kept, when the buffer is full the oldest row is dropped.
+    """
+
+    def __init__(self, pool: asyncpg.pool.Pool, table: str, columns: Sequence[str], *,
+                 batch_size: int=100, max_size: int=5000, flush_interval: float=30.0):
+        self.pool = pool
+        self.table = table
+        self.columns = tuple(columns)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+        self._buffer = deque(maxlen=max_size)
+        self._lock = asyncio.Lock()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._closed = False
+        self._backoff = 0.0
+
+        self.written = 0
+        self.dropped = 0
+        self.delayed = 0
+        self.failures = 0
+
+    def __len__(self) -> int:
+        return len(self._buffer)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._worker())
+
+    def record(self, values: Tuple):
+        if len(self._buffer) == self._buffer.maxlen:
+            self.dropped += 1
+
+        self._buffer.append(values)
+        # while backing off a full batch waits for the next retry instead of waking the worker
+        if len(self._buffer) >= self.batch_size and not self._backoff:
+            self._wakeup.set()
+
+    async def flush(self) -> int:
+        async with self._lock:
+            if not self._buffer:
+                return 0
+
+            records = list(self._buffer)
+            self._buffer.clear()
+
+            try:
+                async with self.pool.acquire() as con:
+                    await con.copy_records_to_table(self.table, records=records, columns=self.columns)
+            except RETRYABLE:
+                log.exception('Failed to flush %d rows to %r', len(records), self.table)
+                self.failures += 1
+
+                # put the rows back in front of anything recorded in the meantime, the deque drops the oldest on overflow
+                free = self._buffer.maxlen - len(self._buffer)
+                self.dropped += max(len(records) - free, 0)
+                self.delayed += min(len(records), free)
+                self._buffer.extendleft(reversed(records[-free:] if free else []))
+                return 0
+            except Exception:
+                # e.g. a value too long for its column or a constraint violation, retrying would only fail again
+                log.exception('Dropping %d rows for %r', len(records), self.table)
+                self.failures += 1
+                self.dropped += len(records)
+                return 0
+
+            self.written += len(records)
+            return len(records)
+
+    async def _worker(self):
+        while not self._closed:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self._backoff or self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+
+            self._wakeup.clear()
+            failures = self.failures
+            try:
+                await self.flush()
+            except Exception:
+                log.exception('Unexpected error while flushing %r', self.table)
+                self.failures += 1
+
+            # retry less and less often while the database is down, up to once per flush interval
+            if self.failures > failures:
+                self._backoff = min(max(self._backoff * 2, MIN_BACKOFF), self.flush_interval)
+            else:
+                self._backoff = 0.0
+
+    async def close(self):
+        self._closed = True
+        if self._task is not None:
+            self._wakeup.set()
+            await self._task
+            self._task = None
+
+        await self.flush()
+        if self._buffer:
+            log.warning('Discarding %d unflushed rows for %r', len(self._buffer), self.table)
+            self.dropped += len(self._buffer)
+            self._buffer.clear()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'pending': len(self._buffer),
+            'written': self.written,
+            'delayed': self.delayed,
+            'dropped': self.dropped,
+            'failures': self.failures,
+        }
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from datetime import datetime
+from types import FrameType
+from typing import List, Optional
+
+from utils.metrics import metrics
+
+log = logging.getLogger(__name__)
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+COGS = os.path.join(ROOT, 'cogs')
+
+
+class Stall:
+    def __init__(self, location: str, stack: List[str]):
+        self.timestamp = datetime.utcnow()
+        self.location = location
+        self.stack = stack
+        self.lag = 0.0
+
+
+def locate(frame: Optional[FrameType]) -> str:
+    """Name the innermost frame that belongs to a cog, falling back to the innermost project frame"""
+    fallback = None
+    while frame is not None:
+        filename = os.path.abspath(frame.f_code.co_filename)
+        if filename.startswith(ROOT):
+            code = frame.f_code
+            name = getattr(code, 'co_qualname', code.co_name)
+            where = f'{os.path.relpath(filename, ROOT)}:{frame.f_lineno} in {name}'
+            if filename.startswith(COGS):
+                return where
+
+            fallback = fallback or where
+
+        frame = frame.f_back
+
+    return fallback or 'unknown'
+
+
+class LoopWatchdog:
+    """Measures how late the event loop wakes up from a short sleep.
+
+       A separate thread checks the last heartbeat and, once the loop has been stuck for longer
+       than `threshold` seconds, logs the stack of whatever the loop thread is executing.
+    """
+
+    def __init__(self, *, threshold: float=0.25, interval: float=0.05):
+        self.threshold = threshold
+        self.interval = interval
+        self.stalls = deque(maxlen=25)
+
+        self._beat = time.monotonic()
+        self._stall: Optional[Stall] = None
+        self._loop_thread: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop: Optional[threading.Event] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    def start(self):
+        if self.running:
+            return
+
+        self._loop_thread = threading.get_ident()
+        self._beat = time.monotonic()
+        self._stall = None  # the heartbeat may have been cancelled before reporting the last one
+
+        # every thread gets its own event, so a thread that is still winding down can't be revived by a restart
+        self._stop = threading.Event()
+        self._task = asyncio.create_task(self._heartbeat())
+        self._thread = threading.Thread(target=self._watch, args=(self._stop,), name='loop-watchdog', daemon=True)
+        self._thread.start()
+        log.info('Event loop watchdog started (threshold %.0fms)', self.threshold * 1000)
+
+    def stop(self):
+        if not self.running:
+            return
+
+        self._task.cancel()
+        self._task = None
+        self._stop.set()
+        self._stop = None
+        self._thread = None
+        log.info('Event loop watchdog stopped')
+
+    async def _heartbeat(self):
+        while True:
+            self._beat = time.monotonic()
+            await asyncio.sleep(self.interval)
+
+            lag = max(time.monotonic() - self._beat - self.interval, 0.0)
+            metrics.observe('loop', 'lag', lag)
+
+            stall = self._stall
+            if stall is not None:
+                stall.lag = lag
+                self._stall = None
+                log.warning('Event loop was blocked for %.0fms in %s', lag * 1000, stall.location)
+
+    def _watch(self, stop: threading.Event):
+        while not stop.wait(self.interval):
+            behind = time.monotonic() - self._beat - self.interval
+            if behind < self.threshold or self._stall is not None:
+                continue
+
+            frame = sys._current_frames().get(self._loop_thread)
+            stack = traceback.format_stack(frame) if frame is not None else []
+            stall = Stall(locate(frame), stack)
+            del frame
+
+            self.stalls.append(stall)
+            self._stall = stall
+            log.warning('Event loop blocked for over %.0fms in %s\n%s', behind * 1000, stall.location, ''.join(stack))